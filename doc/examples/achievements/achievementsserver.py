@@ -7,13 +7,13 @@ class AchievementsCommands(sl.DBServerCommands):
 
     @sl.is_command
     async def achieve(self, *args):
-        self.dbfile.execute("insert into achievement (whenthis, description) values (?, ?)",
-                            (time.time(), " ".join(args),))
-        self.dbfile.commit()
+        async with self.db.transaction():
+            await self.db.execute("insert into achievement (whenthis, description) values (?, ?)",
+                                  (time.time(), " ".join(args),))
 
     @sl.is_command
     async def list(self):
-        return [dict(row) for row in self.dbfile.execute("select * from achievement")]
+        return [dict(row) for row in await self.db.execute("select * from achievement")]
 
 class AchievementsDB(a107.FileSQLite):
     def _do_create_database(self):
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Measures client-server round-trip latency of the "ping" command.
+
+Server and client run in the same process and event loop. Run once on each version to be compared, e.g.:
+
+    python latency.py -n 5000 --pause 0.05
+
+--pause inserts a gap between requests, so that the server main loop is idle when each request arrives.
+
+No reference numbers are recorded here: results depend on the machine, so compare runs made on the same one.
+"""
+import serverlib as sl, a107, argparse, asyncio, time, statistics
+
+
+@sl.is_app
+class server(sl.ServerCfg):
+    _appname = "latency"
+    port = 6670
+    flag_log_console = False
+    flag_log_file = False
+
+
+@sl.is_client(server)
+class client(sl.ClientCfg):
+    pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(p/100*(len(values)-1))))]
+
+
+async def main(args):
+    server.port = client.port = args.port
+    server.flag_router = args.router
+    srv = sl.Server(server)
+    srvtask = asyncio.create_task(srv.run())
+    cli = sl.Client(client)
+    try:
+        await cli.execute_server("ping")  # warm-up (also initializes client)
+        times = []
+        for _ in range(args.n):
+            if args.pause:
+                await asyncio.sleep(args.pause)
+            t = time.perf_counter()
+            await cli.execute_server("ping")
+            times.append(time.perf_counter()-t)
+    finally:
+        await cli.close()
+        srv.stop()
+        await srvtask
+
+    ms = [x*1000 for x in times]
+    print(f"{'ROUTER' if args.router else 'REP'} mode, {args.n} pings, pause {args.pause} s")
+    print(f"  p50 {percentile(ms, 50):.3f} ms")
+    print(f"  p99 {percentile(ms, 99):.3f} ms")
+    print(f"  mean {statistics.mean(ms):.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=a107.SmartFormatter)
+    parser.add_argument("-n", type=int, default=2000, help="Number of pings")
+    parser.add_argument("-p", "--port", type=int, default=server.port, help="Port")
+    parser.add_argument("--pause", type=float, default=0., help="Pause between pings (seconds)")
+    parser.add_argument("--router", action="store_true", help="Uses server ROUTER mode")
+    asyncio.run(main(parser.parse_args()))
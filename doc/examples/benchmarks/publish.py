@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Measures messages per second through Publisher.publish() (no subscribers, so this is the cost on the publisher side).
+
+Run once on each version to be compared, e.g.:
+
+    python publish.py -n 200000 --size 100
+    python publish.py -n 200000 --size 100 --queue --policy drop_oldest
+
+Logging level is INFO unless --debug is passed, i.e., by default debug messages are discarded, which is the case where
+their formatting should cost nothing.
+"""
+import serverlib as sl, a107, argparse, asyncio, time, logging
+
+
+class Master:
+    """Minimal Publisher master: only the logger is needed."""
+    def __init__(self, level):
+        self.logger = logging.getLogger("publish")
+        self.logger.setLevel(level)
+        if level <= logging.DEBUG:
+            # debug output goes nowhere; the point is the cost of formatting it
+            self.logger.addHandler(logging.NullHandler())
+            self.logger.propagate = False
+
+
+async def main(args):
+    publisher = sl.Publisher(Master(logging.DEBUG if args.debug else logging.INFO), args.port,
+                             flag_queue=args.queue, policy=args.policy, batchsize=args.batchsize)
+    await publisher.initialize()
+    msg = b"topic "+b"x"*args.size
+    try:
+        t = time.perf_counter()
+        for _ in range(args.n):
+            await publisher.publish(msg)
+        await publisher.flush()
+        elapsed = time.perf_counter()-t
+    finally:
+        await publisher.close()
+
+    print(f"{args.n} messages of {len(msg)} bytes, debug {'on' if args.debug else 'off'}, "
+          f"{f'queue mode ({args.policy}, batch {args.batchsize})' if args.queue else 'direct mode'}")
+    print(f"  {publisher.stats}")
+    print(f"  {args.n/elapsed:.0f} messages/s")
+    print(f"  {elapsed/args.n*1e6:.2f} µs/message")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=a107.SmartFormatter)
+    parser.add_argument("-n", type=int, default=100000, help="Number of messages")
+    parser.add_argument("-p", "--port", type=int, default=6672, help="Port")
+    parser.add_argument("--size", type=int, default=100, help="Message payload size (bytes)")
+    parser.add_argument("--debug", action="store_true", help="Sets logging level to DEBUG")
+    parser.add_argument("--queue", action="store_true", help="Uses Publisher queue mode")
+    parser.add_argument("--policy", default="block", choices=sl.Publisher.POLICIES, help="Queue full policy")
+    parser.add_argument("--batchsize", type=int, default=256, help="Maximum messages per multipart message")
+    asyncio.run(main(parser.parse_args()))
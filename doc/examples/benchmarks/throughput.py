@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Measures "ping" throughput (statements per second) of the server hot path.
+
+Server and client run in the same process and event loop. Run once on each version to be compared, e.g.:
+
+    python throughput.py -n 20000 -c 8 --router
+
+-c sends that many pings concurrently (the client gets as many sockets, see ClientCfg.poolsize); concurrent pings only
+overlap on the server in ROUTER mode. --logevery sets ServerCfg.commandlogevery, to measure the cost of logging each
+statement.
+"""
+import serverlib as sl, a107, argparse, asyncio, time
+
+
+@sl.is_app
+class server(sl.ServerCfg):
+    _appname = "throughput"
+    port = 6671
+    flag_log_console = False
+    flag_log_file = False
+
+
+@sl.is_client(server)
+class client(sl.ClientCfg):
+    pass
+
+
+async def main(args):
+    server.port = client.port = args.port
+    server.flag_router = args.router
+    server.commandlogevery = args.logevery
+    client.poolsize = args.c
+    srv = sl.Server(server)
+    srvtask = asyncio.create_task(srv.run())
+    cli = sl.Client(client)
+
+    async def pinger(n):
+        for _ in range(n):
+            await cli.execute_server("ping")
+
+    try:
+        await cli.execute_server("ping")  # warm-up (also initializes client)
+        t = time.perf_counter()
+        await asyncio.gather(*[pinger(args.n//args.c) for _ in range(args.c)])
+        elapsed = time.perf_counter()-t
+    finally:
+        await cli.close()
+        srv.stop()
+        await srvtask
+
+    n = args.n//args.c*args.c
+    print(f"{'ROUTER' if args.router else 'REP'} mode, {n} pings, concurrency {args.c}, "
+          f"logging 1/{args.logevery if args.logevery else '∞'}")
+    print(f"  {n/elapsed:.0f} pings/s")
+    print(f"  {elapsed/n*1e6:.1f} µs/ping")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=a107.SmartFormatter)
+    parser.add_argument("-n", type=int, default=10000, help="Number of pings")
+    parser.add_argument("-c", type=int, default=1, help="Concurrency")
+    parser.add_argument("-p", "--port", type=int, default=server.port, help="Port")
+    parser.add_argument("--router", action="store_true", help="Uses server ROUTER mode")
+    parser.add_argument("--logevery", type=int, default=1, help="ServerCfg.commandlogevery (0: no logging)")
+    asyncio.run(main(parser.parse_args()))
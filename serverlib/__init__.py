@@ -1,11 +1,14 @@
 from .cfgclasses import *
 from .decorators import *
 from .basicconversion import *
+from .serializers import *
 from .basicapi import *
 from .status import *
 from .errors import *
 from .config import *
 from .lowstate import *
+from .metrics import *
+from .tracing import *
 from .intelligence import *
 from .commands import *
 from .console import *
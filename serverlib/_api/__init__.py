@@ -11,4 +11,6 @@ from .withsleepers import *
 from .withcfg import *
 from .metacommand import *
 from .helpmaking import *
-from ._misc import *
\ No newline at end of file
+from ._misc import *
+from .wire import *
+from .logqueue import *
\ No newline at end of file
@@ -4,11 +4,12 @@ This file starts with "_" to distinguish from serverlib.basicapi.
 This is actually a miscellanea file.
 """
 
-__all__ = ["get_metacommands", "get_commands", "get_new_logger", "ConsoleShelf"]
+__all__ = ["get_metacommands", "get_commands", "get_new_logger", "release_logger", "ConsoleShelf"]
 
 
-import inspect, logging, a107, os, serverlib as sl, shelve, time, functools
+import inspect, logging, a107, os, serverlib as sl, shelve, time, functools, threading, collections
 from .metacommand import MetaCommand
+from .logqueue import LogQueueHandler, close_handlers
 from colored import fg, attr
 from .. import errors
 
@@ -34,16 +35,32 @@ def get_new_logger(level, flag_log_console, flag_log_file, fn_log, prefix, name)
     """Creates new logger (automatically creates log file directory if needed)."""
     import serverlib as sl
 
+    def make_filehandler():
+        ret = logging.FileHandler(fn_log, "a")
+        ret.setFormatter(logging.Formatter(filefmt))
+        return ret
+
+    def make_consolehandler():
+        ret = logging.StreamHandler()
+        ret.setFormatter(a107.ColorFormatter(fmt=consolefmt, colors=sl.config.logging.colors))
+        return ret
+
     logger = logging.Logger(name, level=level)
+    handlers = []
+    filefmt, consolefmt = sl.config.logging.filefmt, sl.config.logging.consolefmt
 
+    # Handlers are shared among all loggers with same destination and format (see release_logger())
     if flag_log_file:
-        ch = logging.FileHandler(fn_log, "a")
-        ch.setFormatter(logging.Formatter(sl.config.logging.filefmt))
-        logger.addHandler(ch)
+        handlers.append(_acquire_handler((os.path.abspath(fn_log), filefmt), make_filehandler))
 
     if flag_log_console:
-        ch = logging.StreamHandler()
-        ch.setFormatter(a107.ColorFormatter(fmt=sl.config.logging.consolefmt, colors=sl.config.logging.colors))
+        handlers.append(_acquire_handler((None, consolefmt), make_consolehandler))
+
+    if sl.config.logging.flag_queue and handlers:
+        # handlers are used by the writer thread only
+        handlers = [LogQueueHandler(handlers)]
+
+    for ch in handlers:
         logger.addHandler(ch)
 
     # Prefix indicates whether the logging entity will be a server, client or console, and must end with " "
@@ -53,11 +70,74 @@ def get_new_logger(level, flag_log_console, flag_log_file, fn_log, prefix, name)
     else:
         prefix = ""
 
-    logger = logging.LoggerAdapter(logger, {"prefix": prefix})
+    logger = _LoggerAdapter(logger, {"prefix": prefix})
 
     return logger
 
 
+def release_logger(logger):
+    """Detaches handlers from logger created by get_new_logger().
+
+    Handlers no longer used by any logger are kept open for reuse, up to config.logging.maxidlehandlers of them (least
+    recently released ones are closed first).
+    """
+    logger = getattr(logger, "logger", logger)  # LoggerAdapter
+    toclose = []
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        targets = handler.handlers if isinstance(handler, LogQueueHandler) else [handler]
+        with _handlerslock:
+            for target in targets:
+                key = _handlerkeys.get(target)
+                if key is None:
+                    continue
+                entry = _handlers[key]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del _handlers[key]
+                    del _handlerkeys[target]
+                    _idlehandlers[key] = target
+            while len(_idlehandlers) > sl.config.logging.maxidlehandlers:
+                toclose.append(_idlehandlers.popitem(last=False)[1])
+    if toclose:
+        close_handlers(toclose)
+
+
+# Handlers shared among loggers: {(path or None (console), fmt): [handler, number of loggers], ...}
+_handlers = {}
+# {handler: key, ...} (reverse of _handlers)
+_handlerkeys = {}
+# Handlers not used by any logger, least recently released first: {key: handler, ...}
+_idlehandlers = collections.OrderedDict()
+_handlerslock = threading.Lock()
+
+
+def _acquire_handler(key, factory):
+    """Returns handler for key, which is reused or created with factory()."""
+    with _handlerslock:
+        entry = _handlers.get(key)
+        if entry is None:
+            handler = _idlehandlers.pop(key, None)
+            if handler is None:
+                handler = factory()
+            entry = _handlers[key] = [handler, 0]
+            _handlerkeys[handler] = key
+        entry[1] += 1
+        return entry[0]
+
+
+class _LoggerAdapter(logging.LoggerAdapter):
+    """Appends the current trace id (see serverlib.tracing), if any, to the prefix."""
+
+    def process(self, msg, kwargs):
+        trace = sl.get_trace()
+        if trace is None:
+            kwargs["extra"] = self.extra
+        else:
+            kwargs["extra"] = {**self.extra, "prefix": f"{self.extra['prefix']}trace={trace.traceid[:8]} "}
+        return msg, kwargs
+
+
 
 
 
@@ -0,0 +1,158 @@
+"""
+Queued logging: records are handed over to a single writer thread (see config.logging.flag_queue)
+
+Loggers get a LogQueueHandler wrapping their actual handlers. Records are prepared (message formatted) by the logging
+thread, put in a bounded queue shared by all loggers, and written by the writer thread in batches, with one flush per
+stream per batch.
+"""
+
+__all__ = ["LogQueueHandler", "stop_log_writer", "close_handlers"]
+
+import atexit, logging, logging.handlers, queue, threading
+import serverlib as sl
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records to be emitted by handlers in the writer thread.
+
+    Args:
+        handlers: list of logging.Handler. These must not be attached to any logger
+    """
+
+    def __init__(self, handlers):
+        super().__init__(_get_writer().queue)
+        self.handlers = handlers
+
+    def enqueue(self, record):
+        _get_writer().put((self.handlers, record))
+
+
+def stop_log_writer():
+    """Writes pending records and stops writer thread (it is restarted if needed)."""
+    global _writer
+    with _lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def close_handlers(handlers):
+    """Closes handlers, after pending records are written if writer thread is running."""
+    with _lock:
+        writer = _writer
+    if writer is None:
+        for handler in handlers:
+            handler.close()
+    else:
+        writer.close_handlers(handlers)
+
+
+class _LogWriter:
+    def __init__(self, maxsize):
+        # (handlers, record) items, or None (wake-up call)
+        self.queue = queue.Queue(maxsize)
+        # close requests (lists of handlers), kept out of self.queue, where they could be dropped or block the caller
+        self.__closerequests = queue.SimpleQueue()
+        self.__flag_stop = False
+        self.__thread = threading.Thread(target=self.__run, name="logwriter", daemon=True)
+        self.__thread.start()
+
+    def put(self, item):
+        """Enqueues item according to config.logging.queuepolicy."""
+        policy = sl.config.logging.queuepolicy
+        if policy == "block":
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        sl.lowstate.numlogdropped += 1
+        if policy == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(item)
+            except (queue.Empty, queue.Full):
+                pass
+
+    def close_handlers(self, handlers):
+        """Closes handlers after records already enqueued are written. Does not block."""
+        self.__closerequests.put(handlers)
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            # writer is busy and will see the request after current batch
+            pass
+
+    def stop(self):
+        self.__flag_stop = True
+        self.queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < sl.config.logging.queuebatchsize:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+            self.__write(batch)
+            flag_stop = self.__flag_stop
+            if flag_stop or not self.__closerequests.empty():
+                requests = []
+                while not self.__closerequests.empty():
+                    requests.append(self.__closerequests.get_nowait())
+                # records enqueued before the requests are written first
+                rest = []
+                try:
+                    while True:
+                        rest.append(q.get_nowait())
+                except queue.Empty:
+                    pass
+                self.__write(rest)
+                for handlers in requests:
+                    for handler in handlers:
+                        handler.close()
+                if flag_stop:
+                    break
+
+    @staticmethod
+    def __write(batch):
+        """Emits records; streams are flushed once per batch instead of once per record."""
+        touched = set()
+        for item in batch:
+            if item is None:
+                continue
+            handlers, record = item
+            for handler in handlers:
+                if record.levelno < handler.level:
+                    continue
+                if isinstance(handler, logging.StreamHandler) and handler.stream is not None:
+                    try:
+                        handler.stream.write(handler.format(record)+handler.terminator)
+                    except Exception:
+                        handler.handleError(record)
+                    touched.add(handler)
+                else:
+                    handler.handle(record)
+        for handler in touched:
+            handler.flush()
+
+
+_writer = None
+_lock = threading.Lock()
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = _LogWriter(sl.config.logging.queuesize)
+    return _writer
+
+
+atexit.register(stop_log_writer)
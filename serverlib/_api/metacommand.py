@@ -11,9 +11,26 @@ class MetaCommand:
         self.method = method
         self.name = method.__name__
         self.flag_awaitable = inspect.iscoroutinefunction(method)
-        pars = inspect.signature(method).parameters
+        self.signature = inspect.signature(method)
+        pars = self.signature.parameters
         # Note: flag_bargs is only effective on the server side
         flag_bargs = "bargs" in pars
         if flag_bargs and len(pars) > 1:
             raise AssertionError(f"Method {self.name} has argument named 'bargs' which identifies it as a bytes-accepting method, but has extra arguments")
         self.flag_bargs = flag_bargs
+        # Ready-to-await callable: "await invoke(*args, **kwargs)" works whether method is awaitable or not
+        self.invoke = method if self.flag_awaitable else _make_awaitable(method)
+        # Whether method can be called without arguments (spares binding arguments in the common no-arguments case)
+        self.__flag_noargs = all(par.default is not par.empty or par.kind in (par.VAR_POSITIONAL, par.VAR_KEYWORD)
+                                 for par in pars.values())
+
+    def check_arguments(self, args, kwargs):
+        """Raises TypeError if method cannot be called with args and kwargs."""
+        if args or kwargs or not self.__flag_noargs:
+            self.signature.bind(*args, **kwargs)
+
+
+def _make_awaitable(method):
+    async def invoke(*args, **kwargs):
+        return method(*args, **kwargs)
+    return invoke
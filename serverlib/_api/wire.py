@@ -0,0 +1,200 @@
+"""
+Statement and reply envelopes shared by Client and Server
+
+Statement: b"<header> <payload>", where header is "<commandname>" or "<commandname>/<serializername>".
+
+  - untagged statements (header without serializer) are the original format: payload is pickle.dumps([args, kwargs])
+    and the reply is pickle.dumps(result)
+  - tagged statements have the payload serialized with the named serializer, and the reply starts with a
+    one-byte "kind" (see REPLY_* below). Statements whose arguments the chosen serializer cannot handle are tagged
+    "pickle" instead
+
+In both cases, payload may be empty, meaning no arguments. Commands with "bargs" receive payload untouched.
+
+Trace context: header may end with "@<traceid>:<spanid>" (see serverlib.tracing). Client only sends it to servers that
+announce "tracing" in "getd_cfg".
+
+Multipart framing: statement travels as two frames [header, payload] and reply as two frames [kind, payload], plus
+out-of-band pickle buffers, if any (see make_reply_frames()). This allows payloads to be sent and received without
+copies (the server receives payload as a memoryview). Multipart
+statements are always treated as tagged (header without serializer means "pickle").
+"""
+
+__all__ = ["make_statement", "split_statement", "make_reply", "parse_reply",
+           "make_statement_frames", "split_statement_frames", "make_reply_frames", "parse_reply_frames",
+           "REPLY_SERIALIZED", "REPLY_RAW", "REPLY_PICKLE"]
+
+import pickle, serverlib as sl
+
+# reply kinds (tagged statements only)
+REPLY_SERIALIZED = b"s"  # result serialized using the statement serializer
+REPLY_RAW = b"r"  # result is bytes, sent untouched
+REPLY_PICKLE = b"p"  # exceptions, or results that the statement serializer could not handle
+
+
+def make_statement(commandname, args, kwargs, serializer=None, trace=None):
+    """Makes statement bytes
+
+    Args:
+        commandname: str
+        args: list
+        kwargs: dict
+        serializer: serverlib.Serializer or None (untagged statement)
+        trace: serverlib.TraceContext or None
+
+    Returns:
+        (statement, serializer), where serializer is the one the statement is tagged with, to be passed to
+        parse_reply(): arguments that serializer cannot handle are sent with "pickle"
+    """
+    if serializer is None:
+        return _make_header(commandname, None, trace)+b" "+pickle.dumps([args, kwargs]), None
+
+    serializer, payload = _dumps_arguments(args, kwargs, serializer)
+    header = _make_header(commandname, serializer, trace)
+    return (header if payload is None else header+b" "+payload), serializer
+
+
+def split_statement(st):
+    """bytes --> (commandname, serializername, trace, payload) (str, str or None, TraceContext or None, bytes)"""
+    try:
+        idx = st.index(b" ")
+    except ValueError:
+        header, payload = st.decode(), b""
+    else:
+        header, payload = st[:idx].decode(), st[idx+1:]
+    commandname, serializername, trace = _split_header(header)
+    return commandname, serializername, trace, payload
+
+
+def make_reply(result, serializer=None):
+    """Makes reply bytes (may raise if result cannot be pickled)
+
+    Args:
+        result: command result or exception
+        serializer: serverlib.Serializer or None (reply to untagged statement)
+    """
+    if serializer is None:
+        return pickle.dumps(result)
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        return REPLY_RAW+bytes(result)
+    if not isinstance(result, BaseException):
+        try:
+            return REPLY_SERIALIZED+serializer.dumps(result)
+        except Exception:
+            # falls back to pickle
+            pass
+    return REPLY_PICKLE+pickle.dumps(result)
+
+
+def parse_reply(b, serializer=None):
+    """Inverse of make_reply()."""
+    if serializer is None:
+        return pickle.loads(b)
+    kind, payload = b[:1], b[1:]
+    if kind == REPLY_RAW:
+        return payload
+    if kind == REPLY_SERIALIZED:
+        return serializer.loads(payload)
+    if kind == REPLY_PICKLE:
+        return pickle.loads(payload)
+    raise ValueError(f"Invalid reply kind: {kind}")
+
+
+# ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# MULTIPART
+
+def make_statement_frames(commandname, args, kwargs, serializer, trace=None):
+    """Makes [header, payload] frames (payload may be a bytes-like argument passed through without copy).
+
+    Returns (frames, serializer), like make_statement().
+    """
+    if serializer.name == "raw" and len(args) == 1 and not kwargs:
+        # passed through without copy
+        serializer, payload = serializer, args[0]
+    else:
+        serializer, payload = _dumps_arguments(args, kwargs, serializer)
+    return [_make_header(commandname, serializer, trace), b"" if payload is None else payload], serializer
+
+
+def split_statement_frames(frames):
+    """[header, payload] --> (commandname, serializername, trace, payload) (str, str, TraceContext or None, bytes-like)
+    """
+    commandname, serializername, trace = _split_header(bytes(frames[0]).decode())
+    return commandname, serializername or "pickle", trace, frames[1]
+
+
+def make_reply_frames(result, serializer):
+    """Makes [kind, payload, ...] frames
+
+    bytes-like results (bytes, bytearray, memoryview) are sent untouched. Other objects supporting the buffer protocol
+    (e.g. NumPy arrays) are pickled with protocol 5, their contiguous buffers following as extra frames without copy.
+    """
+    if isinstance(result, (bytes, bytearray, memoryview)):
+        return [REPLY_RAW, result]
+    if not isinstance(result, (str, BaseException)):
+        try:
+            memoryview(result)
+        except TypeError:
+            pass
+        else:
+            buffers = []
+            payload = pickle.dumps(result, protocol=5, buffer_callback=lambda b: _append_raw(buffers, b))
+            return [REPLY_PICKLE, payload]+buffers
+    kindpayload = make_reply(result, serializer)
+    return [kindpayload[:1], memoryview(kindpayload)[1:]]
+
+
+def parse_reply_frames(frames, serializer):
+    """Inverse of make_reply_frames(). Raw results are returned as memoryview."""
+    kind, payload = bytes(frames[0]), frames[1]
+    if kind == REPLY_RAW:
+        return payload
+    if kind == REPLY_SERIALIZED:
+        return serializer.loads(payload)
+    if kind == REPLY_PICKLE:
+        return pickle.loads(payload, buffers=frames[2:])
+    raise ValueError(f"Invalid reply kind: {kind}")
+
+
+def _append_raw(buffers, picklebuffer):
+    """buffer_callback for pickle.dumps(): keeps contiguous buffers out-of-band (returns False), others in-band."""
+    try:
+        buffers.append(picklebuffer.raw())
+    except BufferError:
+        return True
+    return False
+
+
+# ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# PAYLOAD & HEADER
+
+def _dumps_arguments(args, kwargs, serializer):
+    """Returns (serializer, payload), falling back to pickle if serializer fails. payload is None if no arguments."""
+    if not args and not kwargs:
+        return serializer, None
+    if serializer.name == "raw":
+        if len(args) != 1 or kwargs:
+            raise TypeError("Serializer 'raw' sends a single bytes-like positional argument only")
+        return serializer, serializer.dumps(args[0])
+    try:
+        return serializer, serializer.dumps([args, kwargs])
+    except Exception:
+        if serializer.name == "pickle":
+            raise
+        serializer = sl.get_serializer("pickle")
+        return serializer, serializer.dumps([args, kwargs])
+
+
+def _make_header(commandname, serializer, trace):
+    header = commandname if serializer is None else f"{commandname}/{serializer.name}"
+    if trace is not None:
+        header += "@"+trace.to_header()
+    return header.encode()
+
+
+def _split_header(header):
+    """str --> (commandname, serializername or None, TraceContext or None)"""
+    header, _, traceheader = header.partition("@")
+    commandname, _, serializername = header.partition("/")
+    trace = sl.TraceContext.from_header(traceheader) if traceheader else None
+    return commandname, serializername or None, trace
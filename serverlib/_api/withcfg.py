@@ -142,6 +142,13 @@ class WithCfg:
                                    name=name)
         return ret
 
+    def release_logger(self, logger):
+        """Releases logger created with get_new_logger() or get_new_sublogger() that will no longer be used.
+
+        Log handlers (and their files) are shared among loggers; this allows them to be closed.
+        """
+        _misc.release_logger(logger)
+
     def dash_suffix_or_not(self, suffix=None):
         """Eventually prefixes suffix with a "-"
 
@@ -1,7 +1,7 @@
 __all__ = ["WithSleepers"]
 
-import asyncio, a107
-from dataclasses import dataclass
+import asyncio, a107, time
+from dataclasses import dataclass, field
 from typing import Any
 
 
@@ -18,14 +18,14 @@ class WithSleepers:
         """Cancel all "naps" created with self.sleep(), or specific one specified by sleepername."""
         if sleepername is not None:
             try:
-                self.__sleepers[sleepername].flag_wake_up = True
+                self.__sleepers[sleepername].wake_up()
             except KeyError:
                 self.logger.debug(f"Sleeper '{sleepername}' not found")
                 if flag_raise:
                     raise
         else:
             for sleeper in self.__sleepers.values():
-                sleeper.flag_wake_up = True
+                sleeper.wake_up()
 
     async def wait_a_bit(self):
         """Unified way to wait for a bit, usually before retrying something that goes wront."""
@@ -49,21 +49,14 @@ class WithSleepers:
             if name in self.__sleepers:
                 raise RuntimeError(f"Sleeper '{name}' already exists")
 
-        my_debug = lambda s: logger.debug(
-            f"😴 {self.__class__.__name__}.sleep() {sleeper.name} {waittime:.3f} seconds {s}")
-        logger = self.logger
-        interval = min(waittime, 0.1)
-
         sleeper = _Sleeper(waittime, name)
         self.__sleepers[sleeper.name] = sleeper
-        slept = 0
         try:
-            # my_debug("💤💤💤")
-            while slept < waittime and not sleeper.flag_wake_up:
-                await asyncio.sleep(interval)
-                slept += interval
+            # Sleeps on the event: costs nothing while idle and wakes up as soon as wake_up() is called
+            await asyncio.wait_for(sleeper.event.wait(), max(0., waittime))
+        except asyncio.TimeoutError:
+            pass
         finally:
-            # my_debug("⏰ Wake up!")
             try:
                 del self.__sleepers[sleeper.name]
             except KeyError:
@@ -73,7 +66,21 @@ class WithSleepers:
 
 @dataclass
 class _Sleeper:
-    seconds: int
+    seconds: float
     name: str
     task: Any = None
-    flag_wake_up: bool = False
+    # set to wake up
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+    starttime: float = field(default_factory=time.time)
+
+    @property
+    def flag_wake_up(self):
+        return self.event.is_set()
+
+    @property
+    def remaining(self):
+        """Remaining time to sleep (seconds)."""
+        return max(0., self.seconds-(time.time()-self.starttime))
+
+    def wake_up(self):
+        self.event.set()
@@ -1,3 +1,4 @@
 from .taskcodes import *
 from .agentserver import *
 from .taskparts import *
+from .taskscheduler import *
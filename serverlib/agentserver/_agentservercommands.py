@@ -15,10 +15,12 @@ class AgentServerCommands(sl.DBServerCommands):
         """Kills all agents and suspends all tasks."""
 
         await self.master.kill_agents()
+        await self.master.flush_task_states()
 
-        db = self.dbfile
-        db.execute("update task set state = ?", (sl.TaskState.suspended,))
-        db.commit()
+        db = self.db
+        async with db.transaction():
+            await db.execute("update task set state = ?", (sl.TaskState.suspended,))
+        self.master.scheduler.clear()
 
 
     @sl.is_command
@@ -46,32 +48,31 @@ class AgentServerCommands(sl.DBServerCommands):
             elif task not in (sl.TaskState.idle, sl.TaskState.suspended, sl.TaskState.inactive):
                 raise ValueError(f"Invalid value for task: '{task}'")
 
-        db = self.dbfile
+        db = self.db
+        await self.master.flush_task_states()
 
         where = "where "+(f"id={task}" if isinstance(task, int)
                           else f"state <> '{sl.TaskState.in_progress}' "
                                f"and state <> '{sl.TaskState.inactive}'" if task == "all"
                           else f"state = '{task}'")
 
-        agentnames = set(db.get_singlecolumn(f"select agentname from task {where}"))
+        async with db.transaction():
+            await db.execute(f"update task set state=?, nexttime=0 {where}", (sl.TaskState.idle,))
+        if flag_single:
+            # task run becomes part of this statement's trace, if any
+            self.master.link_trace(task)
 
-        db.execute(f"update task set state=?, nexttime=0 {where}", (sl.TaskState.idle,))
-        self.dbfile.commit()
-
-        try:
-            # Tries to wake up specific agents involved
-            for agentname in agentnames:
-                self.logger.debug(f"Trying to take up agent '{agentname}'")
-                self.server.wake_up(agentname, flag_raise=True)
-        except KeyError:
-            # If any agent is not found, better to review agents
-            self.server.review_agents()
+        # Scheduler wakes up the agents involved (or spawns them)
+        await self.master.sync_scheduler(where)
 
     @sl.is_command
     async def getd_tasks(self, where=""):
         """Returns list-of-dicts containing all task table columns."""
         if where: where = " where "+where
-        ret = self.dbfile.get_lod(f"select * from task{where}")
+        await self.master.flush_task_states()
+        if self.readpool:
+            return await self.readpool.get_lod(f"select * from task{where}")
+        ret = await self.db.get_lod(f"select * from task{where}")
         return ret
 
     @sl.is_command
@@ -88,49 +89,132 @@ class AgentServerCommands(sl.DBServerCommands):
             kwargs:
 
         returns:
-            None
+            id of the new task
         """
         flag_commit = a107.to_bool(flag_commit)
-        taskcommands = self.master.get_new_taskcommands()
-        if not hasattr(taskcommands, command) or not hasattr(getattr(taskcommands, command), "__call__"):
-            raise ValueError(f"Invalid command '{command}'")
-        if time_of_day is None and interval is None:
-            raise ValueError(f"Please specify at least one of the following: time_of_day, interval")
-
         cols_values = {"command": command, "agentname": agentname, "time_of_day": time_of_day, "interval": interval,}
         cols_values.update(kwargs)
-        if "state" not in cols_values:
-            cols_values["state"] = sl.TaskState.idle
+        self.__check_new_task(cols_values)
 
-        await sl.insert_row(db=self.dbfile,
-                            tablename="task",
-                            cols_values=cols_values)
         if flag_commit:
-            self.dbfile.commit()
+            async with self.db.transaction():
+                taskid = await sl.insert_row(db=self.db, tablename="task", cols_values=cols_values)
+        else:
+            # part of the caller's transaction
+            taskid = await sl.insert_row(db=self.db, tablename="task", cols_values=cols_values)
+        await self.master.sync_scheduler("where id=?", (taskid,), flag_flush=flag_commit)
+        return taskid
+
+    @sl.is_command
+    async def insert_tasks(self, tasks):
+        """
+        Inserts many tasks in a single transaction
+
+        Args:
+            tasks: list of dicts, each one containing the arguments of insert_task() (except flag_commit)
+
+        Returns:
+            number of tasks inserted
+
+        Nothing is inserted if any task is invalid. Next times are calculated for all tasks before inserting.
+        """
+        rows = []
+        for task in tasks:
+            cols_values = {"time_of_day": None, "interval": None}
+            cols_values.update(task)
+            self.__check_new_task(cols_values)
+            sl.convert_values(cols_values)
+            tmp = self.master.AgentTask(**{"lasttime": None, **cols_values})
+            self.master.calculate_nexttime(tmp)
+            cols_values["nexttime"] = tmp.nexttime
+            rows.append(cols_values)
+
+        db = self.db
+        async with db.transaction():
+            maxid = await db.get_scalar("select coalesce(max(id), 0) from task")
+            n = await sl.insert_rows(db=db, tablename="task", rows=rows)
+        await self.master.sync_scheduler("where id>?", (maxid,))
+        return n
+
+    @sl.is_command
+    async def update_tasks(self, where, cols_values):
+        """
+        Updates columns of many tasks in a single transaction, recalculating their next times
+
+        Args:
+            where: condition selecting tasks (without the "where" keyword; empty means all tasks)
+            cols_values: {columnname: value, ...}
+
+        Returns:
+            number of tasks updated
+        """
+        db = self.db
+        cols_values = dict(cols_values)
+        columnnames = await sl.get_columnnames(db, "task")
+        for columnname in cols_values:
+            if columnname not in columnnames:
+                raise ValueError(f"Invalid column: '{columnname}' (valid column names are {columnnames})")
+        await sl.convert_and_validate(cols_values)
+        if "command" in cols_values and not self.master.is_taskcommand(cols_values["command"]):
+            raise ValueError(f"Invalid command '{cols_values['command']}'")
+
+        await self.master.flush_task_states()
+        async with db.transaction():
+            rows = await db.get_lod(f"select * from task{' where '+where if where else ''}")
+            # Applies new values and calculates next times in memory, then writes everything at once
+            names = list(cols_values)+["nexttime"]
+            bindings = []
+            for row in rows:
+                row.update(cols_values)
+                task = self.master.AgentTask(**row)
+                self.master.calculate_nexttime(task)
+                row["nexttime"] = task.nexttime
+                bindings.append([row[name] for name in names]+[row["id"]])
+            await db.executemany(f"update task set {', '.join(f'{name}=?' for name in names)} where id=?",
+                                 bindings)
+        self.master.update_scheduler((row["id"], row["agentname"], row["nexttime"], row["state"]) for row in rows)
+        return len(rows)
 
     @sl.is_command
     async def update_task(self, taskid, **cols_values):
         """Updates columns for identified task"""
-        db = self.dbfile
+        db = self.db
+        await self.master.flush_task_states()
         try:
-            await sl.update_row(db=db,
-                                tablename="task",
-                                id_=taskid,
-                                cols_values=cols_values,
-                                columnnames=None)
-
-            task = self.master.AgentTask(**self.dbfile.get_singlerow("select * from task where id=?", (taskid,)))
-            self.master.calculate_nexttime(task)
-
-            db.execute("update task set nexttime=? where id=?", (task.nexttime, task.id))
-            db.commit()
-        except:
-            db.rollback()
+            async with db.transaction():
+                await sl.update_row(db=db,
+                                    tablename="task",
+                                    id_=taskid,
+                                    cols_values=cols_values,
+                                    columnnames=None)
+
+                task = self.master.AgentTask(**await self.db.get_singlerow("select * from task where id=?", (taskid,)))
+                self.master.calculate_nexttime(task)
+
+                await db.execute("update task set nexttime=? where id=?", (task.nexttime, task.id))
+        except Exception:
+            # rolled back
+            return
+        await self.master.sync_scheduler("where id=?", (task.id,))
 
     @sl.is_command
     async def delete_task(self, taskid):
         """Deletes task identified by taskid"""
 
-        db = self.dbfile
-        db.execute("delete from task where id=?", (taskid,))
-        db.commit()
+        db = self.db
+        async with db.transaction():
+            await db.execute("delete from task where id=?", (taskid,))
+        self.master.scheduler.unschedule(int(taskid))
+
+    # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    # PRIVATE
+
+    def __check_new_task(self, cols_values):
+        """Validates command and schedule of task to be inserted; sets default state."""
+        command = cols_values.get("command")
+        if not self.master.is_taskcommand(command):
+            raise ValueError(f"Invalid command '{command}'")
+        if cols_values.get("time_of_day") is None and cols_values.get("interval") is None:
+            raise ValueError(f"Please specify at least one of the following: time_of_day, interval")
+        if "state" not in cols_values:
+            cols_values["state"] = sl.TaskState.idle
@@ -1,7 +1,8 @@
 __all__ = ["AgentServer"]
 
-import asyncio, a107, traceback, time, inspect, serverlib as sl, json, dateutil, datetime, logging
+import asyncio, a107, traceback, time, inspect, serverlib as sl, json, dateutil, datetime, logging, types
 from .taskcodes import *
+from .taskscheduler import TaskScheduler
 
 
 class AgentServer(sl.DBServer):
@@ -19,6 +20,11 @@ class AgentServer(sl.DBServer):
     def agents(self):
         return self.__agents
 
+    @property
+    def scheduler(self):
+        """In-memory schedule of idle tasks (serverlib.TaskScheduler)."""
+        return self.__scheduler
+
     # todo cleanup
     # @property
     # def sleepername(self):
@@ -48,6 +54,20 @@ class AgentServer(sl.DBServer):
         self.__taskclass = taskclass
         # {agentname: (loop task), ...}
         self.__agents = {}
+        # idle tasks by agent, ordered by nexttime; kept up to date by the task commands and by the agents themselves
+        self.__scheduler = TaskScheduler(on_earlier=self.__on_task_earlier)
+        self.__last_sync_time = None
+        # {command: asyncio.Semaphore, ...}, shared among all agents (see AgentCfg.maxtaskspercommand)
+        self.__commandsemaphores = {}
+        # task state changes not yet written to the database: {taskid: {columnname: value, ...}, ...}
+        self.__pendingstates = {}
+        # task state changes being written to the database (same structure)
+        self.__flushingstates = {}
+        # see taskcommandsignatures; and task commands instance it was worked out from (see is_taskcommand())
+        self.__taskcommandsignatures = None
+        self.__taskcommandsprobe = None
+        # {taskid: serverlib.TraceContext, ...} of statements that triggered tasks (see link_trace())
+        self.__tasktraces = {}
         self._attach_cmd(AgentServerCommands())
 
     # INHERITABLE
@@ -62,6 +82,37 @@ class AgentServer(sl.DBServer):
     def get_new_taskcommands(self):
         return self.__taskcommandsgetter(self)
 
+    @property
+    def taskcommandsignatures(self):
+        """Registry of task commands: read-only {name: inspect.Signature (None if unknown), ...}
+
+        A task commands instance is introspected only once (so methods attached to the instance upon creation are
+        included). Methods inherited from serverlib.Intelligence are not task commands. See also is_taskcommand().
+        """
+        if self.__taskcommandsignatures is None:
+            self.__register_taskcommands(self.get_new_taskcommands())
+        return self.__taskcommandsignatures
+
+    @property
+    def taskcommandnames(self):
+        """Names in the task commands registry (see taskcommandsignatures)."""
+        return self.taskcommandsignatures.keys()
+
+    def is_taskcommand(self, name):
+        """Whether name is a valid task command.
+
+        Names not in the registry are looked up in the introspected task commands instance, as they may be attached
+        to instances later (e.g. upon initialization); the registry rules apply.
+        """
+        return name in self.taskcommandsignatures or \
+            self.__get_late_taskcommand(self.__taskcommandsprobe, name) is not None
+
+    def link_trace(self, taskid):
+        """Makes the next run of task part of the current trace, if any (see serverlib.tracing)."""
+        trace = sl.get_trace()
+        if trace is not None:
+            self.__tasktraces[taskid] = trace
+
     def review_agents(self):
         """Causes agents to be reviewed asap."""
         self.wake_up(self.SLEEPERNAME, flag_raise=False)
@@ -83,21 +134,182 @@ class AgentServer(sl.DBServer):
         except KeyError:
             self.logger.debug(f"Agent '{name}' is already dead")
 
-    def _has_any_in_progress(self):
-        n = self.dbfile.get_scalar("select count(*) from task where state=?", (TaskState.in_progress,))
+    async def write_task_state(self, task):
+        """Records the state columns of task (see TASKSTATECOLUMNS).
+
+        If AgentCfg.statewriteinterval is zero, writes and commits immediately; otherwise, the change is kept in memory
+        and group-committed by flush_task_states() at that interval, or as soon as AgentCfg.statewritemaxpending tasks
+        are pending. A failed write is logged, and the changes are kept to be written next time.
+        """
+        self.__pendingstates[task.id] = {name: getattr(task, name) for name in self.TASKSTATECOLUMNS}
+        if not self.cfg.statewriteinterval or len(self.__pendingstates) >= self.cfg.statewritemaxpending:
+            await self.__try_flush_task_states()
+
+    async def flush_task_states(self):
+        """Writes pending task state changes to the database in a single transaction.
+
+        If writing fails, the changes are kept pending (unless superseded meanwhile) and the exception is re-raised.
+        """
+        if not self.__pendingstates:
+            return
+        pending, self.__pendingstates = self.__pendingstates, {}
+        self.__flushingstates.update(pending)
+        sql = f"update task set {', '.join(f'{name}=?' for name in self.TASKSTATECOLUMNS)} where id=?"
+        try:
+            async with self.db.transaction():
+                await self.db.executemany(sql, [[values[name] for name in self.TASKSTATECOLUMNS]+[taskid]
+                                                for taskid, values in pending.items()])
+        except BaseException:
+            for taskid, values in pending.items():
+                self.__pendingstates.setdefault(taskid, values)
+            raise
+        finally:
+            for taskid, values in pending.items():
+                if self.__flushingstates.get(taskid) is values:
+                    del self.__flushingstates[taskid]
+
+    async def get_task(self, taskid):
+        """Returns task loaded from the database, including state changes not yet written.
+
+        Raises:
+            a107.NoData: task not found
+        """
+        row = dict(await self.db.get_singlerow("select * from task where id=?", (taskid,)))
+        row.update(self.__flushingstates.get(taskid, {}))
+        row.update(self.__pendingstates.get(taskid, {}))
+        return self.__taskclass(**row)
+
+    async def sync_scheduler(self, where="", bindings=(), flag_flush=True):
+        """Updates in-memory task schedule from table "task".
+
+        Args:
+            where: "where ..." clause selecting tasks to update. If not passed, resyncs the whole schedule
+            bindings: bindings for where clause
+            flag_flush: whether to write pending task state changes first. Pass False within a transaction that must not
+                        be committed yet (writing pending changes commits)
+
+        This must be called after the "task" table is modified without using AgentServerCommands. Pending task state
+        changes are written first, as they would otherwise overwrite such modifications.
+        """
+        if flag_flush:
+            await self.flush_task_states()
+        if where:
+            rows = (await self.db.execute(f"select id, agentname, nexttime, state from task {where}",
+                                          bindings)).fetchall()
+            self.update_scheduler(rows)
+            return
+        # Full resync: only idle tasks are read, and only differences are applied, so that agents whose schedule has
+        # not changed are not woken up
+        rows = (await self.db.execute("select id, agentname, nexttime, state from task where state=?",
+                                      (TaskState.idle,))).fetchall()
+        stale = self.__scheduler.taskids-{row[0] for row in rows}
+        for taskid in stale:
+            self.__scheduler.unschedule(taskid)
+        self.update_scheduler(rows)
+        self.__last_sync_time = time.time()
+
+    def update_scheduler(self, rows):
+        """Updates in-memory task schedule from rows (id, agentname, nexttime, state) known to match the database."""
+        for taskid, agentname, nexttime, state in rows:
+            if state == TaskState.idle:
+                self.__scheduler.schedule(taskid, agentname, nexttime)
+            else:
+                self.__scheduler.unschedule(taskid)
+
+    async def _has_any_in_progress(self):
+        await self.flush_task_states()
+        n = await self.db.get_scalar("select count(*) from task where state=?", (TaskState.in_progress,))
         ret = n > 0
         return ret
 
     # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     # OVERRIDE
 
+    async def _do_initialize(self):
+        await super()._do_initialize()
+        # Tasks left "in_progress" were interrupted by a crash (or their final state was never written): runs them again
+        async with self.db.transaction():
+            n = (await self.db.execute("update task set state=? where state=?",
+                                       (TaskState.idle, TaskState.in_progress))).rowcount
+        if n:
+            self.logger.info(f"Reset {n} task(s) from '{TaskState.in_progress}' to '{TaskState.idle}'")
+        await self.sync_scheduler()
+
+    async def _on_close(self):
+        await self.flush_task_states()
+        await super()._on_close()
+
     async def _do_getd_all(self, statedict):
         await super()._do_getd_all(statedict)
         statedict["agents"] = list(self.__agents.keys())
+        statedict["numscheduledtasks"] = len(self.__scheduler)
 
     # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     # PRIVATE
 
+    def __register_taskcommands(self, taskcommands):
+        excluded = set(dir(sl.Intelligence))
+        signatures = {}
+        for name in dir(taskcommands):
+            if name.startswith("__") or name in excluded:
+                continue
+            # getattr_static() keeps properties from being evaluated
+            attr = inspect.getattr_static(taskcommands, name)
+            if isinstance(attr, (staticmethod, classmethod)):
+                attr = attr.__func__
+            if not callable(attr):
+                continue
+            try:
+                signatures[name] = inspect.signature(attr)
+            except (TypeError, ValueError):
+                signatures[name] = None
+        self.__taskcommandsignatures = types.MappingProxyType(signatures)
+        self.__taskcommandsprobe = taskcommands
+
+    @staticmethod
+    def __get_late_taskcommand(taskcommands, name):
+        """Returns method name of taskcommands, following the registry rules, or None."""
+        if not isinstance(name, str) or name.startswith("__") or name in dir(sl.Intelligence):
+            return None
+        ret = getattr(taskcommands, name, None)
+        return ret if callable(ret) else None
+
+    async def __try_flush_task_states(self):
+        """Calls flush_task_states(), logging instead of raising if it fails (it is retried next time)."""
+        try:
+            await self.flush_task_states()
+        except Exception:
+            self.logger.exception(f"Could not write task states ({len(self.__pendingstates)} pending)")
+
+    def __get_command_semaphore(self, command):
+        """Returns semaphore limiting concurrent runs of command across all agents, or None if there is no limit."""
+        ret = self.__commandsemaphores.get(command)
+        if ret is None:
+            limit = self.cfg.maxtaskspercommand.get(command)
+            if limit is None:
+                return None
+            ret = self.__commandsemaphores[command] = asyncio.Semaphore(max(1, limit))
+        return ret
+
+    def __on_task_earlier(self, agentname):
+        """Called by the scheduler when a task is scheduled earlier than all tasks of agentname."""
+        if agentname in self.__agents:
+            self.wake_up(agentname, flag_raise=False)
+        else:
+            self.review_agents()
+
+    @sl.is_loop
+    async def __statewriterloop(self):
+        """Group-commits task state changes every AgentCfg.statewriteinterval seconds."""
+        if not self.cfg.statewriteinterval:
+            return
+        try:
+            while True:
+                await asyncio.sleep(self.cfg.statewriteinterval)
+                await self.__try_flush_task_states()
+        finally:
+            await self.flush_task_states()
+
     @sl.is_loop
     async def __agentloop(self):
         """Spawns/kills agents."""
@@ -118,10 +330,14 @@ class AgentServer(sl.DBServer):
                         raise e
                     del self.__agents[name]
 
+            # --- Resyncs schedule from time to time, in case the task table was modified directly
+            interval = self.cfg.taskresyncinterval
+            if interval and time.time()-self.__last_sync_time >= interval:
+                await self.sync_scheduler()
+
             # --- Spawns (and/or kills) new agents as needed
             existingnames = list(self.__agents.keys())
-            sql = f"select agentname from task where state = '{TaskState.idle}' group by agentname"
-            newnames = self.dbfile.get_singlecolumn(sql)
+            newnames = self.__scheduler.agentnames
 
             # ------ Kills agents
             if self.__FLAG_KILL:
@@ -175,50 +391,74 @@ class AgentServer(sl.DBServer):
         """
 
         # ──────────────────────────────────────────────────────────────
-        async def run_tasks_sequentially():
-            """Tasks are executed sequentially.
+        async def start_tasks(taskids):
+            """Starts tasks (which are due according to the scheduler), up to AgentCfg.maxtasksperagent at a time.
 
-            Returns: (waittime, minnexttime, num_run)
-                waittime: time to wait until this method should be called again (seconds); or if preferred,
-                minnexttime: minimum next time among all tasks run
-                num_run: number of tasks run
+            Blocks while all slots are taken. With maxtasksperagent=1, tasks run sequentially.
             """
-
-            nexttimes = []
-            num_run = 0
+            nonlocal flag_failed
             for taskid in taskids:
+                if taskid in inflight:
+                    # 🕵 says: already started (e.g. schedule was rebuilt while task was waiting for its command slot)
+                    continue
+                await slots.acquire()
+                if flag_failed:
+                    # will wait progressively longer at each failed task
+                    flag_failed = False
+                    agentlogger.info(f"Will wait {waiter_f.nexttime:.2f} seconds before running next task")
+                    try:
+                        await waiter_f.wait()
+                    except BaseException:
+                        slots.release()
+                        raise
+                inflight[taskid] = asyncio.create_task(run_in_slot(taskid), name=f"{agentname}#{taskid}")
+
+        # ──────────────────────────────────────────────────────────────
+        async def run_in_slot(taskid):
+            """Runs one task, then releases its slot."""
+            nonlocal flag_failed
+            try:
                 try:
-                    task = self.__taskclass(**self.dbfile.get_singlerow("select * from task where id=?", (taskid,)))
+                    task = await self.get_task(taskid)
                 except a107.NoData:
                     agentlogger.debug(f"Task #{taskid} not found, skipping ...")
-                    continue
+                    return
 
                 if task.state != TaskState.idle:
                     agentlogger.debug(f"Task #{task.id} is '{task.state}', skipping ...")
-                    continue
+                    return
+
+                if task.nexttime <= time.time():
+                    semaphore = self.__get_command_semaphore(task.command)
+                    with sl.span(f"{self.subappname}:task:{task.command}", parent=self.__tasktraces.pop(taskid, None),
+                                 taskid=taskid):
+                        if semaphore is None:
+                            flag_success = await run_task(task)
+                        else:
+                            async with semaphore:
+                                flag_success = await run_task(task)
 
-                if task.nexttime < time.time():
-                    num_run += 1
-                    flag_success = await run_task(task, taskcommands)
                     if flag_success:
                         # waiter is reset when task succeeds
                         waiter_f.reset()
                         self._last_finished_time = time.time()
-
                     else:
-                        # will wait progressively longer at each failed task
-                        agentlogger.info(f"Task #{task.id} failed, "
-                                         f"will wait {waiter_f.nexttime:.2f} seconds before running next task")
-                        await waiter_f.wait()
+                        agentlogger.info(f"Task #{task.id} failed")
+                        flag_failed = True
 
-                nexttimes.append(task.nexttime)
+                if task.state == TaskState.idle:
+                    self.__scheduler.schedule(task.id, task.agentname, task.nexttime)
 
-            minnexttime = min(nexttimes) if len(nexttimes) > 0 else None
-            waittime = max(0, minnexttime - time.time())
-            return waittime, minnexttime, num_run
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                agentlogger.exception(f"Error running task #{taskid}")
+            finally:
+                del inflight[taskid]
+                slots.release()
 
         # ────────────────────────────────────
-        async def run_task(task, taskcommands):
+        async def run_task(task):
             """Exception handling center. Treats all exceptions except CancelledError, which is re-raised
 
             Returns:
@@ -228,20 +468,22 @@ class AgentServer(sl.DBServer):
             async def es(**kwargs):
                 for k, v in kwargs.items():
                     setattr(task, k, v)
-                sql = "update task set lasttime=?, nexttime=?, lasterror=?, state=?, result=? where id=?"
-                self.dbfile.execute(sql,
-                    (task.lasttime, task.nexttime, task.lasterror, task.state, task.result, task.id))
-                self.dbfile.commit()
+                await self.write_task_state(task)
 
             # === BEGIN task execution
 
-            agentlogger.debug(f"taking task {task} at {a107.now_str()}")
+            sl.log_lazy(agentlogger, logging.DEBUG, lambda: f"taking task {task} at {a107.now_str()}")
 
             await es(lasterror="", result=TaskResult.none, state=TaskState.in_progress, lasttime=time.time())
 
             try:
                 # Runs task here
-                method = getattr(taskcommands, task.command)
+                method = methods.get(task.command)
+                if method is None:
+                    # not in registry; may have been attached to the instance (e.g. upon initialization)
+                    method = self.__get_late_taskcommand(taskcommands, task.command)
+                    if method is None:
+                        raise ValueError(f"Invalid task command '{task.command}'")
 
                 await method(task)
 
@@ -262,6 +504,7 @@ class AgentServer(sl.DBServer):
             except (asyncio.CancelledError):
                 # If cancelled, sets task to be run again asap
                 await es(state=TaskState.idle, nexttime=0)
+                self.__scheduler.schedule(task.id, task.agentname, task.nexttime)
                 raise
 
             except BaseException as e:
@@ -272,14 +515,14 @@ class AgentServer(sl.DBServer):
                     # Fail with retry: computes next time to run task after waiting interval (if there are many tasks in
                     # queue, it may take longer)
                     task.state = TaskState.idle
-                    task.nexttime = e.waittime if e.waittime is not None else self.cfg.waittime_retry_task
+                    task.nexttime = time.time()+(e.waittime if e.waittime is not None else self.cfg.waittime_retry_task)
                 else:
                     # General fail case: will suspend the task and set to run as soon as un-suspended
                     task.state = TaskState.suspended
                     task.nexttime = 0.
 
-                agentlogger.error(f"Error executing task #{task.id}! Details:\n"+
-                                  json.dumps(task.to_dict(), indent=4))
+                sl.log_lazy(agentlogger, logging.ERROR,
+                            lambda: f"Error executing task #{task.id}! Details:\n"+json.dumps(task.to_dict(), indent=4))
                 agentlogger.exception(f"Error executing task #{task.id}!")
                 await es()
                 return False
@@ -289,7 +532,8 @@ class AgentServer(sl.DBServer):
                 task.result = TaskResult.success
                 task.state = TaskState.idle
                 self.calculate_nexttime(task)
-                agentlogger.debug(f"next time for command '{task.command}' is {a107.ts2str(task.nexttime)}")
+                sl.log_lazy(agentlogger, logging.DEBUG,
+                            lambda: f"next time for command '{task.command}' is {a107.ts2str(task.nexttime)}")
                 await es()
 
             return True
@@ -302,34 +546,39 @@ class AgentServer(sl.DBServer):
         # controls waiting in case of failed task
         waiter_f = sl.Waiter(self, description="Failed task", sleepername=agentname, logger=agentlogger,
                              flag_quiet=True)
+        # whether some task failed since the last wait
+        flag_failed = False
+        # {taskid: (asyncio task), ...} of tasks running (or waiting for their command slot)
+        inflight = {}
+        slots = asyncio.Semaphore(max(1, self.cfg.maxtasksperagent))
 
         try:
             # dbclient = self.get_dbclient()
             taskcommands = self.get_new_taskcommands()
+            if self.__taskcommandsignatures is None:
+                self.__register_taskcommands(taskcommands)
+            # bound task command methods: {command: method, ...}
+            methods = {name: getattr(taskcommands, name) for name in self.__taskcommandsignatures}
             await taskcommands.initialize()
             try:
                 while True:
                     try:
-                        taskids = self.dbfile.get_singlecolumn("select id from task where agentname=? and state=?",
-                                                               (agentname, TaskState.idle))
+                        taskids = self.__scheduler.pop_due(agentname)
+
+                        if taskids:
+                            agentlogger.debug(f"Got {len(taskids)} due tasks to care for")
+                            await start_tasks(taskids)
+                            continue
 
-                        if not taskids:
+                        # Sleeps until next task is due; the scheduler wakes me up if some task is scheduled earlier
+                        nexttime = self.__scheduler.get_nexttime(agentname)
+                        if nexttime is None:
                             # 🕵 says: Probably all tasks were suspended, or even deleted, after I was spawned.
                             #          If this no-task situation persists, the server will soon kill me.
                             agentlogger.debug(f"Got no tasks to care for, so sleeping for a bit ...")
-
                             await self.sleep(self.cfg.waittime_no_tasks, agentname)
-                            continue
-
                         else:
-                            agentlogger.debug(f"Got {len(taskids)} tasks to care for")
-
-                        waittime, minnexttime, num_run = await run_tasks_sequentially()
-
-                        if num_run == 0:
-                            await self.sleep(self.cfg.waittime_no_tasks, agentname)
-                        elif waittime > 0:
-                            await self.sleep(waittime, agentname)
+                            await self.sleep(max(0., nexttime-time.time()), agentname)
 
                     except sl.Retry as e:
                         waittime = self.cfg.waittime_retry_task if e.waittime is None else e.waittime
@@ -339,6 +588,11 @@ class AgentServer(sl.DBServer):
 
             finally:
                 agentlogger.debug(f"on its 'finally:'")
+                # tasks cancelled mid-way are set to run again asap (see run_task())
+                running = list(inflight.values())
+                for child in running:
+                    child.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
                 await taskcommands.close()
                 agentlogger.debug(f"succeeded on its 'finally:'")
         except asyncio.CancelledError:
@@ -348,6 +602,9 @@ class AgentServer(sl.DBServer):
             agentlogger.debug(f"️💀️ crashed with: '{a107.str_exc(e)}'")
             if not isinstance(e, (KeyboardInterrupt, asyncio.CancelledError)):
                 traceback.print_exc()
+        finally:
+            # agent may be respawned many times; does not leave its log handlers behind
+            self.release_logger(agentlogger)
 
         # END agent life
 
@@ -365,11 +622,14 @@ class AgentServer(sl.DBServer):
                 tmp += datetime.timedelta(days=1)
             a = tmp.timestamp()
         if task.interval is not None:
-            b = task.lasttime + task.interval
+            # task never run is due now
+            b = (task.lasttime or 0.) + task.interval
         task.nexttime = min(a, b)
 
     class AgentTask(a107.AutoClass):
         pass
 
     SLEEPERNAME = "__agentloop"
+    # columns written at each task state change
+    TASKSTATECOLUMNS = ("lasttime", "nexttime", "lasterror", "state", "result")
     __FLAG_KILL = False
@@ -0,0 +1,101 @@
+"""In-memory schedule of idle tasks, which spares agents from polling the database."""
+
+__all__ = ["TaskScheduler"]
+
+import heapq, time
+
+
+class TaskScheduler:
+    """Priority queues of idle tasks keyed on nexttime, one per agent.
+
+    Args:
+        on_earlier: callback(agentname) called when the earliest nexttime for an agent becomes earlier, i.e., the agent
+                    may need to be woken up
+
+    Heaps use lazy deletion: a heap entry (nexttime, taskid) is valid only if it matches the current schedule of the
+    task; other entries are discarded when they reach the top of the heap.
+    """
+
+    @property
+    def agentnames(self):
+        """Names of agents having at least one task scheduled."""
+        return [agentname for agentname, count in self.__counts.items() if count > 0]
+
+    @property
+    def taskids(self):
+        """Set of ids of tasks scheduled."""
+        return set(self.__tasks)
+
+    def __init__(self, on_earlier=None):
+        # {taskid: (agentname, nexttime), ...}
+        self.__tasks = {}
+        # {agentname: [(nexttime, taskid), ...], ...}
+        self.__heaps = {}
+        # {agentname: number of tasks scheduled, ...}
+        self.__counts = {}
+        self.__on_earlier = on_earlier
+
+    def __len__(self):
+        return len(self.__tasks)
+
+    def __contains__(self, taskid):
+        return taskid in self.__tasks
+
+    def clear(self):
+        self.__tasks.clear()
+        self.__heaps.clear()
+        self.__counts.clear()
+
+    def schedule(self, taskid, agentname, nexttime):
+        """Schedules (or re-schedules) task."""
+        current = self.__tasks.get(taskid)
+        if current == (agentname, nexttime):
+            return
+        if current is not None:
+            self.__counts[current[0]] -= 1
+        earliest = self.get_nexttime(agentname)
+        self.__tasks[taskid] = (agentname, nexttime)
+        self.__counts[agentname] = self.__counts.get(agentname, 0)+1
+        heap = self.__heaps.setdefault(agentname, [])
+        heapq.heappush(heap, (nexttime, taskid))
+        self.__compact(agentname)
+        if self.__on_earlier and (earliest is None or nexttime < earliest):
+            self.__on_earlier(agentname)
+
+    def unschedule(self, taskid):
+        """Removes task from schedule (no error if not scheduled)."""
+        current = self.__tasks.pop(taskid, None)
+        if current is not None:
+            self.__counts[current[0]] -= 1
+
+    def get_nexttime(self, agentname):
+        """Returns earliest nexttime among tasks scheduled for agent, or None."""
+        heap = self.__heaps.get(agentname)
+        while heap:
+            nexttime, taskid = heap[0]
+            if self.__tasks.get(taskid) == (agentname, nexttime):
+                return nexttime
+            heapq.heappop(heap)
+        return None
+
+    def pop_due(self, agentname, now=None):
+        """Removes from schedule and returns ids of agent's tasks due at "now" (defaults to current time), earliest first.
+        """
+        if now is None:
+            now = time.time()
+        ret = []
+        heap = self.__heaps.get(agentname)
+        while heap and heap[0][0] <= now:
+            nexttime, taskid = heapq.heappop(heap)
+            if self.__tasks.get(taskid) == (agentname, nexttime):
+                self.unschedule(taskid)
+                ret.append(taskid)
+        return ret
+
+    def __compact(self, agentname):
+        """Rebuilds heap if stale entries outnumber valid ones."""
+        heap = self.__heaps[agentname]
+        count = self.__counts[agentname]
+        if len(heap) > 2*count+64:
+            heap[:] = [entry for entry in heap if self.__tasks.get(entry[1]) == (agentname, entry[0])]
+            heapq.heapify(heap)
@@ -2,7 +2,7 @@
 Miscellaneous routines that are part of serverlib itself, but may be used externally as well
 """
 
-__all__ = ["retry_on_cancelled", "get_client_and_cfg", "get_server_and_cfg", "SCPair", "get_dataroot"]
+__all__ = ["retry_on_cancelled", "get_client_and_cfg", "get_server_and_cfg", "SCPair", "get_dataroot", "log_lazy"]
 
 import asyncio, a107, os
 import serverlib as sl
@@ -112,4 +112,18 @@ def get_dataroot():
         dataroot = sl.config.defaultdataroot
     if "~" in dataroot:
         dataroot = os.path.expanduser(dataroot)
-    return dataroot
\ No newline at end of file
+    return dataroot
+
+
+def log_lazy(logger, level, fn, *args, **kwargs):
+    """Logs message fn(*args, **kwargs) only if logger is enabled for level.
+
+    For messages that are expensive to build (e.g. dumps, decoding), which would otherwise be built even if discarded.
+
+    Example:
+
+    >>> sl.log_lazy(logger, logging.DEBUG, json.dumps, task.to_dict(), indent=4)
+    >>> sl.log_lazy(logger, logging.DEBUG, lambda: f"Received '{msg.decode()}'")
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, fn(*args, **kwargs))
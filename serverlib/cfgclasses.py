@@ -30,8 +30,20 @@ class ConsoleCfg(BaseCfg):
 class ServerCfg(BaseCfg):
     host = "*"
     port = None
-    # time to sleep at each server main loop cycle
-    sleepinterval = 0.01
+    # whether to bind a ROUTER socket (instead of REP) and execute each statement in its own asyncio task, so that a
+    # slow command does not block other clients. REQ-based clients work with both modes
+    flag_router = False
+    # maximum number of statements being executed at the same time (ROUTER mode only)
+    maxinflight = 100
+    # serializers accepted from clients (see serverlib.serializers)
+    serializers = ("pickle", "msgpack", "raw")
+    # logs one of every commandlogevery statements received ("$ <commandname>"). 1: logs all; 0: logs none
+    commandlogevery = 1
+    # logging level of the statement log above
+    commandloglevel = logging.INFO
+    # fraction of statements whose handling phases (parse, execute, serialize, send) are timed into the per-command
+    # histograms of "getd_metrics". 0: none (call/error/in-flight counts are still kept); 1: all
+    metricssampling = 0.
 
 
 class ClientCfg(BaseCfg):
@@ -42,6 +54,18 @@ class ClientCfg(BaseCfg):
     waittime_retry_command = .1
     # maximum number of retries for a retriable command
     maxtries = 3
+    # serializer to use if accepted by server; otherwise falls back to "pickle" (see serverlib.serializers). "raw" is not
+    # valid here: it is used automatically, per call, to send a single bytes-like argument to server "bargs" commands
+    serializer = "pickle"
+    # whether to send statements as multipart messages (if server supports it), i.e., command header and payload in
+    # separate frames, avoiding copies of large payloads. **Note** in this mode, bytes-like results are returned as
+    # memoryview, and server "bargs" commands receive a memoryview
+    flag_multipart = False
+    # maximum number of sockets to the server, allowing as many execute_server() calls to run in parallel (one REQ
+    # socket can only handle one request at a time)
+    poolsize = 1
+    # whether to start a new trace (see serverlib.tracing) for each statement sent to the server outside of a trace
+    flag_trace = False
 
 
 class AgentCfg(ServerCfg):
@@ -51,6 +75,17 @@ class AgentCfg(ServerCfg):
     waittime_retry_task = 1.
     # time to wait if agent found no tasks to execute
     waittime_no_tasks = 10.
+    # maximum number of tasks that each agent runs concurrently (1: agent runs its tasks sequentially)
+    maxtasksperagent = 1
+    # {command: maximum number of concurrent runs of command across all agents, ...}; commands not listed are unlimited
+    maxtaskspercommand = {}
+    # interval to group-commit task state changes (seconds). 0: every change is committed immediately
+    statewriteinterval = 0.2
+    # number of pending task state changes that triggers a commit before statewriteinterval elapses
+    statewritemaxpending = 500
+    # interval to resync the in-memory task schedule with the database, in case table "task" is modified by other means
+    # than the server commands (0: never). Only differences are applied, so unchanged agents are not woken up
+    taskresyncinterval = 300
 
 
 
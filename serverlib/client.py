@@ -1,5 +1,6 @@
-import zmq, zmq.asyncio, pickle, a107, serverlib as sl, asyncio
+import zmq, zmq.asyncio, a107, serverlib as sl, asyncio, contextlib
 from . import _api
+from .console import _capi
 
 __all__ = ["Client"]
 
@@ -24,14 +25,28 @@ class Client(sl.Console):
         # It is reset by any of the execute*() methods
         self.temporarytimeout = None
 
-        self.__ctx, self.__socket = None, None
+        self.__ctx = None
+        # Socket pool: idle sockets ready to be leased, and limit on the number of sockets (ClientCfg.poolsize)
+        self.__idlesockets = []
+        # sockets leased by execute*() calls going on
+        self.__leasedsockets = set()
+        self.__numsockets = 0
+        self.__poolsemaphore = asyncio.Semaphore(max(1, self.cfg.poolsize))
+        # Serializer agreed with server upon initialization. None means untagged statements (see serverlib._api.wire)
+        self.__serializer = None
+        # Whether to send statements as multipart messages (also agreed upon initialization)
+        self.__flag_multipart = False
+        # Whether server accepts trace context within statements (see serverlib.tracing)
+        self.__flag_tracing = False
+        # Server "bargs" commands, to which a single bytes-like argument is sent with serializer "raw", if accepted
+        self.__bargscommands = frozenset()
 
     # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     # INTERFACE
 
     # async def connect(self):
     #     await self._assure_initialized()
-    #     self.__assure_socket()
+    #     self.__assure_context()
 
     async def execute(self, *args, **kwargs):
         try:
@@ -54,8 +69,8 @@ class Client(sl.Console):
             raise TypeError(f"I need str, not {statement.__class__.__name__}")
         try:
             await self._assure_initialized()
-            self._parse_statement(statement, args, kwargs)
-            return await self.__execute_server()
+            data = self._parse_statement(statement, args, kwargs)
+            return await self.__execute_server(data)
 
         finally:
             self.temporarytimeout = None
@@ -75,20 +90,65 @@ class Client(sl.Console):
         finally:
             self.temporarytimeout = None
 
+    async def execute_many(self, statements, flag_raise=False):
+        """Executes many statements on the server in a single round trip.
+
+        Args:
+            statements: list whose items may be a statement str, or (statement, args), or (statement, args, kwargs)
+            flag_raise: whether to raise the first exception found among results
+
+        Returns:
+            list containing, for each statement, either its result or the exception raised on the server
+        """
+        items = []
+        for item in statements:
+            if isinstance(item, str):
+                item = (item,)
+            statement, args, kwargs = (tuple(item)+((), {}))[:3]
+            data = _capi.parse_statement(statement, list(args), dict(kwargs))
+            items.append((data.commandname, data.args, data.kwargs))
+
+        ret = await self.execute_server("execute_batch", items)
+        for result in ret:
+            if isinstance(result, BaseException):
+                result.from_server = True
+                if flag_raise:
+                    raise result
+        return ret
+
+    def batch(self):
+        """Returns a batch to be used as an async context manager; statements are sent together on exit.
+
+        Example:
+
+        >>> async with client.batch() as batch:
+        >>>     for i in range(1000):
+        >>>         batch.execute("insert_task", f"agent{i}", "do_sth", interval=60)
+        >>> print(batch.results)
+        """
+        return _Batch(self)
+
     # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     # OVERRIDEN
 
     async def _initialize_client(self):
-        self.__assure_socket()
-        server_subappname = await self._get_server_subappname()
+        self.__assure_context()
+        srvcfg = await self.__execute_server_no_init("getd_cfg")
+        server_subappname = self.__get_subappname_from_cfg(srvcfg)
 
         # client and server subappname must match
         if self.subappname != server_subappname:
             raise sl.MismatchError(f'Client x Server subappname mismatch '
                                    f'(\'{self.subappname}\' x \'{server_subappname}\')')
 
+        self.__negotiate_serializer(srvcfg)
+
     async def _get_server_subappname(self):
         srvcfg = await self.__execute_server_no_init("getd_cfg")
+        return self.__get_subappname_from_cfg(srvcfg)
+
+    @staticmethod
+    def __get_subappname_from_cfg(srvcfg):
         ret = srvcfg["_subappname"]
         if ret is None:
             ret = srvcfg["_appname"]
@@ -101,10 +161,13 @@ class Client(sl.Console):
         return await self.execute_server("get_welcome")
 
     async def _do_close(self):
-        if self.__socket is not None:
-            self.__del_socket()
-            self.__ctx.destroy()
-            sl.lowstate.numcontexts -= 1
+        if self.__ctx is not None:
+            while self.__idlesockets:
+                self.__del_socket(self.__idlesockets.pop())
+            for socket in list(self.__leasedsockets):
+                self.__del_socket(socket)
+            sl.release_context(self.__ctx)
+            self.__ctx = None
 
     async def _do_execute(self):
         flag_try_server = False
@@ -114,7 +177,7 @@ class Client(sl.Console):
             # Note: I don't want to raise another exception inside here; that's why I use this flag instead
             flag_try_server = True
         if flag_try_server:
-            ret = await self.__execute_server()
+            ret = await self.__execute_server(self._statementdata)
         return ret
 
     async def _do_help(self, refilter=None, fav=None, favonly=None, antifav=None):
@@ -150,41 +213,97 @@ class Client(sl.Console):
     # PRIVATE
 
     def __make_socket(self):
-        self.__del_socket()
-        self.__socket = self.__ctx.socket(zmq.REQ)
+        self.__assure_context()
+        socket = self.__ctx.socket(zmq.REQ)
         sl.lowstate.numsockets += 1
-        self.__set_timeout(self.cfg.timeout)
-        self.logger.info(f"Connecting {self.name}, ``{self.subappname}(client)'', to {self.url} ...")
-        self.__socket.connect(self.url)
-
-    def __set_timeout(self, timeout):
+        self.__numsockets += 1
+        self.__set_timeout(socket, self.cfg.timeout)
+        self.logger.info(f"Connecting {self.name}, ``{self.subappname}(client)'' "
+                         f"(socket {self.__numsockets}/{self.cfg.poolsize}), to {self.url} ...")
+        socket.connect(self.url)
+        return socket
+
+    @staticmethod
+    def __set_timeout(socket, timeout):
         zmqtimeout = int(timeout*1000)  # ZMQ needs timeout in milliseconds
-        self.__assure_socket()
-        self.__socket.setsockopt(zmq.SNDTIMEO, zmqtimeout)
-        self.__socket.setsockopt(zmq.RCVTIMEO, zmqtimeout)
+        socket.setsockopt(zmq.SNDTIMEO, zmqtimeout)
+        socket.setsockopt(zmq.RCVTIMEO, zmqtimeout)
 
     def __make_context(self):
-        self.__ctx = zmq.asyncio.Context()
-        sl.lowstate.numcontexts += 1
+        self.__ctx = sl.acquire_context()
 
-    def __assure_socket(self):
+    def __assure_context(self):
         if self.__ctx is None:
             self.__make_context()
-        if self.__socket is None:
-            self.__make_socket()
+
+    @contextlib.asynccontextmanager
+    async def __lease_socket(self):
+        """Leases socket from pool, creating new socket if none is idle.
+
+        A REQ socket cannot have more than one request going on, so each concurrent call gets a socket of its own; up
+        to ClientCfg.poolsize calls run in parallel, the other ones wait. A socket whose call raised (zmq.ZMQError, or
+        was cancelled, e.g. by a timeout) is in an unknown state of the REQ send/receive cycle, so it is discarded
+        instead of returning to the pool.
+        """
+        async with self.__poolsemaphore:
+            socket = self.__idlesockets.pop() if self.__idlesockets else self.__make_socket()
+            self.__leasedsockets.add(socket)
+            try:
+                yield socket
+            except BaseException:
+                self.__del_socket(socket)
+                raise
+            else:
+                self.__leasedsockets.discard(socket)
+                self.__idlesockets.append(socket)
 
     async def __execute_server_no_init(self, statement, *args, **kwargs):
         """Executes command on server without initialization check."""
-        self._parse_statement(statement, args, kwargs)
-        return await self.__execute_server()
-
-    async def __execute_server(self):
-        data = self._statementdata
-        bst = data.commandname.encode()+b" "+pickle.dumps([data.args, data.kwargs])
+        data = self._parse_statement(statement, args, kwargs)
+        return await self.__execute_server(data)
+
+    def __get_call_serializer(self, data):
+        """Returns "raw" serializer to send single bytes-like argument to "bargs" command, otherwise session one."""
+        if data.commandname in self.__bargscommands and len(data.args) == 1 and not data.kwargs \
+                and isinstance(data.args[0], (bytes, bytearray, memoryview)):
+            return sl.get_serializer("raw")
+        return self.__serializer
+
+    def __negotiate_serializer(self, srvcfg):
+        """Picks serializer based on server configuration obtained with "getd_cfg"."""
+        servernames = srvcfg.get("serializers")
+        self.__flag_tracing = bool(srvcfg.get("tracing"))
+        if servernames is None:
+            # server predates serializers: keeps untagged statements
+            self.__serializer = None
+            return
+        name = self.cfg.serializer
+        if name == "raw":
+            # cannot carry [args, kwargs]; only used per call (see __get_call_serializer())
+            self.logger.warning("Serializer 'raw' cannot be used for all statements; falling back to 'pickle'")
+            name = "pickle"
+        elif name not in servernames:
+            self.logger.warning(f"Serializer '{name}' not accepted by server (accepted: {servernames}); "
+                                f"falling back to 'pickle'")
+            name = "pickle"
+        self.__serializer = sl.get_serializer(name)
+        self.__bargscommands = frozenset(srvcfg.get("bargscommands", ())) if "raw" in servernames else frozenset()
+        self.__flag_multipart = bool(self.cfg.flag_multipart and srvcfg.get("multipart"))
+
+    async def __execute_server(self, data):
+        with sl.span(f"{self.subappname}(client):{data.commandname}", flag_new_trace=self.cfg.flag_trace) as trace:
+            return await self.__execute_server_traced(data, trace if self.__flag_tracing else None)
+
+    async def __execute_server_traced(self, data, trace):
+        serializer = self.__get_call_serializer(data)
+        if self.__flag_multipart:
+            bst, serializer = _api.make_statement_frames(data.commandname, data.args, data.kwargs, serializer, trace)
+        else:
+            bst, serializer = _api.make_statement(data.commandname, data.args, data.kwargs, serializer, trace)
         i = 0
         while True:
             try:
-                return await self.__execute_bytes(bst)
+                return await self.__execute_bytes(bst, serializer)
             except sl.Retry as e:
                 i += 1
                 if i == self.cfg.maxtries:
@@ -195,46 +314,67 @@ class Client(sl.Console):
                                   f"(attempt {i}/{self.cfg.maxtries}) (will retry in {waittime} seconds)")
                 await asyncio.sleep(waittime)
 
-    async def __execute_bytes(self, bst):
+    async def __execute_bytes(self, bst, serializer=None):
+        """bst may be bytes or a list of frames (multipart)."""
         def process_result(b):
-            ret = pickle.loads(b)
+            ret = _api.parse_reply_frames(b, serializer) if flag_multipart else _api.parse_reply(b, serializer)
             if isinstance(ret, BaseException):
                 ret.from_server = True
                 raise ret
             return ret
 
-        flag_temporarytimeout = self.temporarytimeout is not None
+        flag_multipart = isinstance(bst, list)
+        temporarytimeout = self.temporarytimeout
         try:
-            if flag_temporarytimeout:
-                self.__set_timeout(self.temporarytimeout)
-            socket = self.__get_socket()
-            await socket.send(bst)
-            b = await socket.recv()
-        except zmq.Again as e:
-            raise sl.Retry(a107.str_exc(e))
+            async with self.__lease_socket() as socket:
+                if temporarytimeout is not None:
+                    self.__set_timeout(socket, temporarytimeout)
+                try:
+                    if flag_multipart:
+                        await socket.send_multipart(bst, copy=False)
+                        b = [zframe.buffer for zframe in await socket.recv_multipart(copy=False)]
+                    else:
+                        await socket.send(bst)
+                        b = await socket.recv()
+                finally:
+                    if temporarytimeout is not None:
+                        self.__set_timeout(socket, self.cfg.timeout)
         except zmq.ZMQError as e:
-            # 20210912 This makes more sense, i.e., deleting the socket only after ruling out less serious situations
-            self.__del_socket()
+            # (zmq.Again included) socket has been discarded, as it is in an unknown state
             raise sl.Retry(a107.str_exc(e))
-        finally:
-            if flag_temporarytimeout:
-                self.__set_timeout(self.cfg.timeout)
 
         ret = process_result(b)
         return ret
 
-    def __del_socket(self):
-        if self.__socket is not None:
-            try:
-                self.__socket.setsockopt(zmq.LINGER, 0)
-                self.__socket.close()
-                sl.lowstate.numsockets -= 1
-            except zmq.ZMQError as e:
-                raise
-            except:
-                raise
-            self.__socket = None
+    def __del_socket(self, socket):
+        """Closes socket, idle or leased (no error if already closed)."""
+        self.__leasedsockets.discard(socket)
+        if socket.closed:
+            return
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.close()
+        sl.lowstate.numsockets -= 1
+        self.__numsockets -= 1
+
+
+
+class _Batch:
+    """Collects statements to be executed with Client.execute_many(). See Client.batch()."""
+
+    def __init__(self, client):
+        self.client = client
+        self.statements = []
+        # list of results or exceptions, available after exiting the context
+        self.results = None
+
+    def execute(self, statement, *args, **kwargs):
+        """Schedules statement for execution; returns its index within self.results."""
+        self.statements.append((statement, args, kwargs))
+        return len(self.statements)-1
+
+    async def __aenter__(self):
+        return self
 
-    def __get_socket(self):
-        self.__assure_socket()
-        return self.__socket
+    async def __aexit__(self, type_, value, traceback):
+        if type_ is None and self.statements:
+            self.results = await self.client.execute_many(self.statements)
@@ -1,6 +1,6 @@
 __all__ = ["BasicServerCommands"]
 
-import asyncio
+import asyncio, a107
 from colored import fg, bg, attr
 from serverlib import is_command
 from .commands import ServerCommands
@@ -56,6 +56,31 @@ class BasicServerCommands(ServerCommands):
         """Returns "pong"."""
         return "pong"
 
+    @is_command
+    async def execute_batch(self, statements):
+        """Executes many statements in a row, in the order given.
+
+        Args:
+            statements: list of (commandname, args, kwargs)
+
+        Returns:
+            list containing, for each statement, either its result or the exception it raised
+        """
+        ret = []
+        for commandname, args, kwargs in statements:
+            try:
+                command = self.master.metacommands[commandname]
+            except KeyError:
+                ret.append(sl.StatementError(f"Command is non-existing: '{commandname}'"))
+                continue
+            try:
+                command.check_arguments(args, kwargs)
+            except TypeError as e:
+                ret.append(sl.StatementError(f"Invalid arguments for '{commandname}': {e}"))
+                continue
+            ret.append(await self.master._execute_command(command, args, kwargs))
+        return ret
+
     @is_command
     async def stop(self):
         """Stops server. """
@@ -79,7 +104,8 @@ class BasicServerCommands(ServerCommands):
     @is_command
     async def getd_sleepers(self):
         """Reports server sleepers as a list of dicts."""
-        ret = [{"name": sleeper.name, "seconds": sleeper.seconds} for sleeper in self.master.sleepers.values()]
+        ret = [{"name": sleeper.name, "seconds": sleeper.seconds, "remaining": sleeper.remaining}
+               for sleeper in self.master.sleepers.values()]
         return ret
 
     @is_command
@@ -88,6 +114,36 @@ class BasicServerCommands(ServerCommands):
         ret = [loopdata.to_dict() for loopdata in self.master.loops]
         return ret
 
+    @is_command
+    async def getd_metrics(self, flag_histograms=True):
+        """Reports per-command metrics: number of calls, errors and in-flight executions, plus phase histograms.
+
+        Args:
+            flag_histograms: whether to include phase histograms (parse, execute, serialize, send). Histograms are fed
+                             only by the sampled fraction of statements (see ServerCfg.metricssampling)
+        """
+        flag_histograms = a107.to_bool(flag_histograms)
+        return self.master.metrics.to_dict(flag_histograms)
+
+    @is_command
+    async def get_metrics_prometheus(self):
+        """Returns metrics (see getd_metrics()) in the Prometheus text exposition format."""
+        return self.master.metrics.to_prometheus({"server": self.master.subappname})
+
+    @is_command
+    async def reset_metrics(self):
+        """Zeroes metrics reported by getd_metrics()."""
+        self.master.metrics.reset()
+
+    @is_command
+    async def set_metrics_sampling(self, sampling):
+        """Sets fraction of statements to be timed (0 <= sampling <= 1) and returns previous value."""
+        sampling = float(sampling)
+        if not 0 <= sampling <= 1:
+            raise ValueError(f"Invalid sampling: {sampling}")
+        ret, self.master.metrics.sampling = self.master.metrics.sampling, sampling
+        return ret
+
     @is_command
     async def getd_lowstate(self):
         """Returns serverlib's "lowstate" for server
@@ -98,7 +154,19 @@ class BasicServerCommands(ServerCommands):
 
     @is_command
     async def getd_cfg(self):
-        return sl.cfg2dict(self.cfg)
+        """Returns server configuration, plus what the client needs to know about the wire format
+
+        "serializers" lists only the accepted serializers available on the server; "bargscommands" lists the commands
+        that receive their payload untouched; "multipart" tells that server understands multipart statements;
+        "tracing", that statements may carry a trace context.
+        """
+        ret = sl.cfg2dict(self.cfg)
+        ret["serializers"] = [name for name in self.cfg.serializers
+                              if name in sl.serializers and sl.serializers[name].is_available()]
+        ret["bargscommands"] = [name for name, command in self.master.metacommands.items() if command.flag_bargs]
+        ret["multipart"] = True
+        ret["tracing"] = True
+        return ret
 
     @is_command
     async def getd_all(self):
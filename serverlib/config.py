@@ -39,11 +39,28 @@ class config:
     # maximum number of attempts
     waiter_maxtries: int = 10
 
+    # -- ZMQ
+    # number of I/O threads of the ZMQ context shared within the process (see serverlib.acquire_context())
+    io_threads = 1
+
     # -- Other configuration
     # Description width in welcome message
     descriptionwidth = 100
     killagenttimeout = 30
 
+    # -- Server-side database cursors (see DBServerCommands_FileSQLite.open_cursor())
+    # default number of rows returned by each fetch_next() call
+    cursorchunksize = 1000
+    # cursors not fetched for this long are closed (seconds)
+    cursortimeout = 300
+    # maximum number of cursors open at the same time
+    maxcursors = 16
+
+    # -- Tracing (see serverlib.tracing)
+    # file to append spans to (Chrome trace event format). None: spans are not exported (trace ids are still propagated
+    # and logged)
+    tracefile = None
+
     # -- Exclusive access console shelf
     # lock timeout
     shelftimeout = .2
@@ -82,3 +99,19 @@ class config:
         level = logging.INFO
         flag_console = True
         flag_file = True
+
+        # whether loggers hand records over to a single writer thread instead of writing them in the calling thread
+        # (see serverlib._api.logqueue). Applies to loggers created afterwards
+        flag_queue = False
+        # maximum number of records waiting to be written
+        queuesize = 10000
+        # what to do when queue is full: "drop_newest" (discards record being logged); "drop_oldest" (discards
+        # oldest record waiting); "block" (waits for room, blocking the caller). Dropped records are counted in
+        # lowstate.numlogdropped
+        queuepolicy = "drop_newest"
+        # maximum number of records written between flushes
+        queuebatchsize = 256
+
+        # Log handlers are shared among loggers with the same destination (see serverlib._api.release_logger()).
+        # Maximum number of handlers kept open after their last logger is released (e.g., for respawned agents)
+        maxidlehandlers = 8
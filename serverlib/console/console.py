@@ -1,6 +1,6 @@
 __all__ = ["Console"]
 
-import atexit, sys, signal, readline, a107, time, serverlib as sl, os, random
+import atexit, sys, signal, readline, a107, time, serverlib as sl, os, random, asyncio
 from contextlib import redirect_stdout
 from colored import attr
 
@@ -37,6 +37,8 @@ class Console(_api.WithCommands, _api.WithClosers, _api.WithCfg, _api.WithConsol
         _api.WithClosers.__init__(self)
         _api.WithConsole.__init__(self)
         self.__state = CSt.INIT
+        # prevents concurrent calls to _assure_initialized() from initializing twice
+        self.__initlock = asyncio.Lock()
         self.flag_needs_to_reset_colors = False
         self.__state = CSt.ALIVE
 
@@ -220,12 +222,14 @@ class Console(_api.WithCommands, _api.WithClosers, _api.WithCfg, _api.WithConsol
     async def _assure_initialized(self):
         """Initialize-on-demand"""
         if self.__state < CSt.INITIALIZED:
-            self.read_configfile()
-            await self._initialize_cmd()
-            await self._initialize_closers()
-            await self._initialize_client()
-            await self._on_initialize()
-            self.__state = CSt.INITIALIZED
+            async with self.__initlock:
+                if self.__state < CSt.INITIALIZED:
+                    self.read_configfile()
+                    await self._initialize_cmd()
+                    await self._initialize_closers()
+                    await self._initialize_client()
+                    await self._on_initialize()
+                    self.__state = CSt.INITIALIZED
 
     async def _execute_console(self):
         data = self._statementdata
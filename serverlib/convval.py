@@ -7,9 +7,10 @@ Based on ancient sacca::convert_and_validate_args.py
 
 __all__ = ["convert_values", "update_row", "validate_values", "convert_and_validate",
            "converters", "validators", "insert_row", "normalize_time_of_day", "validate_time_of_day",
-           "convert_rows", "powertabulatemap"]
+           "convert_rows", "powertabulatemap", "insert_rows", "get_columnnames", "invalidate_schema_cache",
+           "is_ddl"]
 
-import inspect, a107, pl3, textwrap
+import inspect, a107, pl3, textwrap, weakref, functools, re
 import dateutil
 
 
@@ -88,11 +89,48 @@ async def validate_values(cols_values):
         raise ValueError("\n".join(errors))
 
 
+# Schema cache: {FileSQLite object: {tablename: [columnname, ...], ...}, ...}
+_schemacache = weakref.WeakKeyDictionary()
+
+
+async def get_columnnames(db, tablename):
+    """Returns names of the columns of table except "id". Cached per connection (see invalidate_schema_cache())."""
+    key = _get_dbfile(db)
+    tables = _schemacache.setdefault(key, {})
+    ret = tables.get(tablename)
+    if ret is None:
+        ret = tables[tablename] = [row["name"] for row in await _dbcall(db, "describe", tablename)
+                                   if row["name"] != "id"]
+    return ret
+
+
+def invalidate_schema_cache(db, tablename=None):
+    """Forgets cached columns of tablename, or of all tables if not passed.
+
+    AsyncDB calls this automatically after DDL statements (see is_ddl()) and create_database(). Code changing the
+    schema through the FileSQLite object directly must call it.
+    """
+    tables = _schemacache.get(_get_dbfile(db))
+    if tables is not None:
+        if tablename is None:
+            tables.clear()
+        else:
+            tables.pop(tablename, None)
+
+
+def is_ddl(statement):
+    """Returns whether SQL statement may change the schema."""
+    return _ddlpattern.match(statement) is not None
+
+
+_ddlpattern = re.compile(r"\s*(create|alter|drop)\b", re.IGNORECASE)
+
+
 async def update_row(db, tablename, id_, cols_values, columnnames=None):
     """Updates single table row using pairs columnname=value
 
     Args:
-        db: a107.FileSQLite
+        db: serverlib.AsyncDB (preferred) or a107.FileSQLite
         tablename:
         id_: row id within table (fieldname must be "id")
         cols_values: list or dict. If list, must come in pairs [columnname0, value0, columnname1, value1, ...]; if dict,
@@ -103,17 +141,12 @@ async def update_row(db, tablename, id_, cols_values, columnnames=None):
 
     # Gets columnnames
     if columnnames is None:
-        columnnames = [row["name"] for row in db.describe(tablename) if row["name"] != "id"]
+        columnnames = await get_columnnames(db, tablename)
 
     # Converts cols_values to dict
     if isinstance(cols_values, (list, tuple)):
         cols_values = _convert_to_dict(cols_values)
 
-    # Probes existence of id_ in table
-    rows = db.execute(f"select id from {tablename} where id=?", (id_,)).fetchall()
-    if not rows:
-        raise a107.NoData(f"Invalid id for table '{tablename}': {id_}")
-
     # Conversion
     convert_values(cols_values)
 
@@ -124,26 +157,30 @@ async def update_row(db, tablename, id_, cols_values, columnnames=None):
     await validate_values(cols_values)
 
     bindings = list(cols_values.values())+[id_]
-    equals = ", ".join([f"{columnname}=?" for columnname in cols_values])
-    sqlito = f"update {tablename} set {equals} where id=?"
-    db.execute(sqlito, bindings)
+    sqlito = _make_update_sql(tablename, tuple(cols_values))
+    # Checks existence of id_ in table by the number of rows updated
+    if (await _dbcall(db, "execute", sqlito, bindings)).rowcount == 0:
+        raise a107.NoData(f"Invalid id for table '{tablename}': {id_}")
 
 
 async def insert_row(db, tablename, cols_values, columnnames=None):
     """Updates single table row using pairs columnname=value
 
     Args:
-        db: a107.FileSQLite
+        db: serverlib.AsyncDB (preferred) or a107.FileSQLite
         tablename:
         cols_values: list or dict. If list, must come in pairs [columnname0, value0, columnname1, value1, ...]; if dict,
                      {columnname0: value0, columnname1: value1, ...}
         columnnames: list of column names that may be accepted. If not specified, will query the database for the
                      columns of table and accept any column name except "id"
+
+    Returns:
+        id of the inserted row
     """
 
     # Gets columnnames
     if columnnames is None:
-        columnnames = [row["name"] for row in db.describe(tablename) if row["name"] != "id"]
+        columnnames = await get_columnnames(db, tablename)
 
     # Converts cols_values to dict
     if isinstance(cols_values, (list, tuple)):
@@ -158,9 +195,73 @@ async def insert_row(db, tablename, cols_values, columnnames=None):
             raise ValueError(f"Invalid column: '{columnname}' (valid column names are {columnnames})")
     await validate_values(cols_values)
 
-    colnames, bindings = zip(*((k, v) for k, v in cols_values.items()))
-    sqlito = f"insert into {tablename} ({','.join(colnames)}) values ({','.join(['?']*len(bindings))})"
-    db.execute(sqlito, bindings)
+    sqlito = _make_insert_sql(tablename, tuple(cols_values))
+    return (await _dbcall(db, "execute", sqlito, list(cols_values.values()))).lastrowid
+
+
+async def insert_rows(db, tablename, rows, columnnames=None):
+    """Inserts many rows using executemany(), one call for each distinct set of columns.
+
+    Args:
+        db: serverlib.AsyncDB (preferred) or a107.FileSQLite
+        tablename:
+        rows: list of cols_values (see insert_row())
+        columnnames: see insert_row()
+
+    Returns:
+        number of rows inserted
+
+    Column names are checked once for each set of columns; values are converted and validated row by row. Nothing is
+    inserted if any row is invalid.
+    """
+
+    if columnnames is None:
+        columnnames = await get_columnnames(db, tablename)
+
+    # {(columnname, ...): [bindings, ...], ...}
+    groups = {}
+    for cols_values in rows:
+        if isinstance(cols_values, (list, tuple)):
+            cols_values = _convert_to_dict(cols_values)
+        else:
+            cols_values = dict(cols_values)
+        convert_values(cols_values)
+        key = tuple(cols_values)
+        group = groups.get(key)
+        if group is None:
+            for columnname in key:
+                if columnname not in columnnames:
+                    raise ValueError(f"Invalid column: '{columnname}' (valid column names are {columnnames})")
+            group = groups[key] = []
+        await validate_values(cols_values)
+        group.append(list(cols_values.values()))
+
+    for key, bindings in groups.items():
+        await _dbcall(db, "executemany", _make_insert_sql(tablename, key), bindings)
+    return sum(len(bindings) for bindings in groups.values())
+
+
+@functools.lru_cache(maxsize=256)
+def _make_insert_sql(tablename, colnames):
+    return f"insert into {tablename} ({','.join(colnames)}) values ({','.join(['?']*len(colnames))})"
+
+
+@functools.lru_cache(maxsize=256)
+def _make_update_sql(tablename, colnames):
+    return f"update {tablename} set {', '.join([f'{columnname}=?' for columnname in colnames])} where id=?"
+
+
+def _get_dbfile(db):
+    """AsyncDB --> its FileSQLite object; FileSQLite object --> itself."""
+    return getattr(db, "dbfile", db)
+
+
+async def _dbcall(db, methodname, *args):
+    """Calls db.<methodname>(*args), db being either a serverlib.AsyncDB or a FileSQLite object."""
+    ret = getattr(db, methodname)(*args)
+    if inspect.isawaitable(ret):
+        ret = await ret
+    return ret
 
 
 def _convert_to_dict(cols_values):
@@ -5,4 +5,7 @@ from .dbservercommands import *
 from .shelfservercommands import *
 from .dbservercommands_filesqlite import *
 from .shelfclient import *
+from .cursorclient import *
+from .readpool import *
+from .asyncdb import *
 from .dbserver import *
@@ -0,0 +1,170 @@
+__all__ = ["AsyncDB"]
+
+import asyncio, contextlib, functools, serverlib as sl
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDB:
+    """Awaitable facade over a FileSQLite object (DBServer.dbfile).
+
+    Args:
+        dbfile: a107.FileSQLite instance
+        executor: single-thread executor in which all database calls run, or None (calls run inline, in the event loop)
+
+    Use threaded() to create the FileSQLite object inside its own thread. In this case, the FileSQLite object belongs to
+    that thread (sqlite3 objects cannot be shared between threads), so the FileSQLite object must **not** be used
+    directly anymore, only through this facade. With a single thread, calls are executed in the order they were made.
+
+    Migration from self.dbfile: ``self.dbfile.method(...)`` becomes ``await self.db.method(...)``. execute() returns an
+    ExecuteResult, which supports the common uses of the cursor returned by FileSQLite.execute() (iteration, fetchall(),
+    lastrowid, rowcount). Anything else can be wrapped in a function and passed to run().
+
+    Transactions: all coroutines share one connection, hence one transaction. Between two awaits of a multi-statement
+    write, another coroutine may run and commit or roll back the statements executed so far. Writes that must be
+    atomic, or that roll back on error, must therefore be made within ``async with self.db.transaction():``, which
+    serializes them. Outside such a block, execute(), executemany(), commit() and rollback() wait for any transaction()
+    block of another task to finish, so that they do not commit or discard part of it; however, an execute() followed
+    by a separate commit() is not atomic and should be replaced by a transaction() block.
+    """
+
+    @property
+    def flag_thread(self):
+        """Whether database calls run in a dedicated thread."""
+        return self.__executor is not None
+
+    def __init__(self, dbfile, executor=None):
+        self.dbfile = dbfile
+        self.__executor = executor
+        # created on first use, inside the event loop
+        self.__txlock = None
+        # task running a transaction() block
+        self.__txowner = None
+
+    @classmethod
+    def threaded(cls, factory):
+        """Creates AsyncDB with a dedicated thread, in which dbfile = factory() is also created."""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dbwriter")
+        dbfile = executor.submit(factory).result()
+        return cls(dbfile, executor)
+
+    async def run(self, fn, *args, **kwargs):
+        """Calls fn(*args, **kwargs) in the database thread (or inline) and returns its result."""
+        if self.__executor is None:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, functools.partial(fn, *args, **kwargs))
+
+    async def execute(self, statement, bindings=()):
+        """Executes statement and returns ExecuteResult (rows already fetched)."""
+        await self.__wait_transaction()
+        try:
+            return await self.run(self.__execute, statement, bindings)
+        finally:
+            if sl.is_ddl(statement):
+                sl.invalidate_schema_cache(self)
+
+    async def executemany(self, statement, bindings):
+        await self.__wait_transaction()
+        try:
+            return await self.run(self.__executemany, statement, bindings)
+        finally:
+            if sl.is_ddl(statement):
+                sl.invalidate_schema_cache(self)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Async context manager that runs a block as one transaction: commits on exit, rolls back on exception.
+
+        Transactions are serialized: a block waits until any other transaction() block has finished. Not reentrant.
+        """
+        if self.__txlock is None:
+            self.__txlock = asyncio.Lock()
+        async with self.__txlock:
+            self.__txowner = asyncio.current_task()
+            try:
+                try:
+                    yield self
+                except BaseException:
+                    # includes cancellation, otherwise the next commit would write a partial transaction
+                    await self.rollback()
+                    raise
+                await self.commit()
+            finally:
+                self.__txowner = None
+
+    async def commit(self):
+        await self.__wait_transaction()
+        return await self.run(self.dbfile.commit)
+
+    async def rollback(self):
+        await self.__wait_transaction()
+        return await self.run(self.dbfile.rollback)
+
+    async def get_lod(self, *args, **kwargs):
+        return await self.run(self.dbfile.get_lod, *args, **kwargs)
+
+    async def get_scalar(self, *args, **kwargs):
+        return await self.run(self.dbfile.get_scalar, *args, **kwargs)
+
+    async def get_singlecolumn(self, *args, **kwargs):
+        return await self.run(self.dbfile.get_singlecolumn, *args, **kwargs)
+
+    async def get_singlerow(self, *args, **kwargs):
+        return await self.run(self.dbfile.get_singlerow, *args, **kwargs)
+
+    async def describe(self, tablename):
+        return await self.run(lambda: list(self.dbfile.describe(tablename)))
+
+    async def show_tables(self):
+        return await self.run(lambda: list(self.dbfile.show_tables()))
+
+    async def create_database(self, *args, **kwargs):
+        try:
+            return await self.run(self.dbfile.create_database, *args, **kwargs)
+        finally:
+            sl.invalidate_schema_cache(self)
+
+    async def close(self):
+        """Closes dbfile and stops the database thread (only used with a dedicated thread; see DBServer)."""
+        if self.__executor is not None:
+            await self.run(self.dbfile.close)
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+    # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    # PRIVATE
+
+    async def __wait_transaction(self):
+        """Waits until no other task is within a transaction() block."""
+        lock = self.__txlock
+        if lock is not None and lock.locked() and self.__txowner is not asyncio.current_task():
+            async with lock:
+                pass
+
+    def __execute(self, statement, bindings):
+        cursor = self.dbfile.execute(statement, bindings)
+        return ExecuteResult(cursor.fetchall(), cursor.lastrowid, cursor.rowcount, cursor.description)
+
+    def __executemany(self, statement, bindings):
+        cursor = self.dbfile.executemany(statement, bindings)
+        rowcount = cursor.rowcount if cursor is not None else -1
+        return ExecuteResult([], None, rowcount, None)
+
+
+class ExecuteResult:
+    """Rows fetched by AsyncDB.execute(), plus cursor attributes lastrowid, rowcount and description."""
+
+    def __init__(self, rows, lastrowid, rowcount, description):
+        self.rows = rows
+        self.lastrowid = lastrowid
+        self.rowcount = rowcount
+        self.description = description
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def fetchall(self):
+        return self.rows
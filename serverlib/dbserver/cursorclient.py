@@ -0,0 +1,54 @@
+"""Parts for multiple inheritance (see also ShelfClient)."""
+import serverlib as sl
+
+__all__ = ["CursorClient"]
+
+
+class CursorClient:
+    """Streams query results from a DBServer through self.dbclient, using server-side cursors."""
+
+    dbclient: sl.Client
+
+    async def iter_chunks(self, statement, bindings=(), rowformat="list", chunksize=None):
+        """Async iterator yielding chunks of at most chunksize rows (see DBServerCommands_FileSQLite.open_cursor()).
+
+        Chunks are lists of rows, or {colname: column, ...} if rowformat is "columns".
+
+        Example:
+
+        >>> async for rows in self.iter_chunks("select * from task", chunksize=5000):
+        >>>     process(rows)
+        """
+        if chunksize is None:
+            chunksize = sl.config.cursorchunksize
+        cursorid = await self.dbclient.execute_server("open_cursor", statement, bindings, rowformat)
+        flag_done = False
+        try:
+            while not flag_done:
+                rows = await self.dbclient.execute_server("fetch_next", cursorid, chunksize)
+                numrows = _count_rows(rows)
+                # server closes cursor as soon as it returns an incomplete chunk
+                flag_done = numrows < chunksize
+                if numrows:
+                    yield rows
+        finally:
+            if not flag_done:
+                await self.dbclient.execute_server("close_cursor", cursorid)
+
+    async def iter_rows(self, statement, bindings=(), rowformat="list", chunksize=None):
+        """Async iterator yielding rows one by one, fetched from the server in chunks.
+
+        rowformat "columns" is not accepted (use iter_chunks() instead).
+        """
+        if rowformat == "columns":
+            raise ValueError("iter_rows() does not accept rowformat 'columns' (use iter_chunks())")
+        async for rows in self.iter_chunks(statement, bindings, rowformat, chunksize):
+            for row in rows:
+                yield row
+
+
+def _count_rows(chunk):
+    """Number of rows in chunk returned by "fetch_next" (dict means "columns" row format)."""
+    if isinstance(chunk, dict):
+        return len(next(iter(chunk.values()), []))
+    return len(chunk)
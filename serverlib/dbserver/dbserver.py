@@ -1,6 +1,8 @@
 __all__ = ["DBServer"]
 
 import serverlib as sl, shelve, os, a107
+from .readpool import ReadPool
+from .asyncdb import AsyncDB
 
 class DBServer(sl.Server):
     """SQLite database server with shelf ("shelve") option
@@ -9,6 +11,22 @@ class DBServer(sl.Server):
         fileclass: some MySQLite descendant class, or None (SQLite database is optional)
         flag_shelf: whether of not the server will implement "shelve" capability (if yes, the server will provide
                     commands through a sacca.ServerCommands_Shelf)
+        journal_mode: SQLite journal mode, e.g. "wal" (recommended with numreaders > 0, as WAL readers and writer do
+                      not block each other). None: SQLite default
+        synchronous: e.g. "normal" (safe and faster with "wal"), "full". None: SQLite default
+        cache_size: SQLite page cache size (negative: kibibytes; positive: pages). None: SQLite default
+        mmap_size: maximum number of bytes of the database file to access through memory-mapped I/O. None: SQLite
+                   default
+        busy_timeout: time that a connection waits for a lock before giving up (seconds). None: SQLite default
+        numreaders: number of read-only connections (see ReadPool) on which read-only commands run in worker threads.
+                    0: all commands run on the main connection, in the event loop
+        flag_dbthread: whether to run all calls on the main connection in a dedicated thread (see AsyncDB). If True,
+                       the database must be accessed through self.db only, never through self.dbfile
+
+    Note: read-only commands running on readers do not see changes that were not committed yet.
+
+    Database access: self.db (serverlib.AsyncDB) is the awaitable interface to the database and should be preferred;
+    self.dbfile (FileSQLite object) still works as long as flag_dbthread is False.
     """
 
     @property
@@ -21,14 +39,35 @@ class DBServer(sl.Server):
         """Returns the path to the shelf file."""
         return self.filepath("sqlite", ".sqlite")
 
-    def __init__(self, *args, fileclass=None, flag_shelf=False, **kwargs):
+    def __init__(self, *args, fileclass=None, flag_shelf=False, journal_mode=None, synchronous=None, cache_size=None,
+                 mmap_size=None, busy_timeout=None, numreaders=0, flag_dbthread=False, **kwargs):
         sl.Server.__init__(self, *args, **kwargs)
 
         assert issubclass(self.cfg, sl.ServerCfg)
 
+        # {pragmaname: value, ...} for all connections
+        self.pragmas = {name: value for name, value in (("synchronous", synchronous),
+                                                        ("cache_size", cache_size),
+                                                        ("mmap_size", mmap_size),
+                                                        ("busy_timeout", None if busy_timeout is None
+                                                                         else int(busy_timeout*1000)))
+                        if value is not None}
+        self.journal_mode = journal_mode
         self.dbfile = None
+        # awaitable facade over self.dbfile
+        self.db = None
+        # read-only connections (None if numreaders == 0)
+        self.readpool = None
         if fileclass:
-            self.dbfile = self._append_closer(fileclass(self.dbpath, master=self))
+            if flag_dbthread:
+                # AsyncDB creates dbfile in its thread, and closes it
+                self.db = self._append_closer(AsyncDB.threaded(lambda: fileclass(self.dbpath, master=self)))
+                self.dbfile = self.db.dbfile
+            else:
+                self.dbfile = self._append_closer(fileclass(self.dbpath, master=self))
+                self.db = AsyncDB(self.dbfile)
+            if numreaders > 0:
+                self.readpool = self._append_closer(ReadPool(self.dbpath, numreaders, self.pragmas))
         if flag_shelf:
             self.shelf = self._append_closer(shelve.open(self.shelfpath))
             self._attach_cmd(sl.ShelfServerCommands())
@@ -41,8 +80,18 @@ class DBServer(sl.Server):
             if a107.ensure_path(d):
                 self.logger.info(f"Created directory '{d}'")
 
-            self.dbfile.create_database()
+            await self.db.create_database()
+            await self.db.run(self.__apply_pragmas)
 
     async def _on_close(self):
         if self.dbfile:
-            self.dbfile.commit()
+            await self.db.commit()
+
+    def __apply_pragmas(self):
+        conn = self.dbfile.conn
+        if self.journal_mode is not None:
+            mode = conn.execute(f"pragma journal_mode={self.journal_mode}").fetchone()[0]
+            if mode.lower() != self.journal_mode.lower():
+                self.logger.warning(f"Could not set journal mode to '{self.journal_mode}' (it is '{mode}')")
+        for name, value in self.pragmas.items():
+            conn.execute(f"pragma {name}={value}")
@@ -3,7 +3,17 @@ __all__ = ["DBServerCommands"]
 import serverlib as sl
 
 class DBServerCommands(sl.ServerCommands):
-    """Provides dbfile property"""
+    """Provides db, dbfile and readpool properties"""
+    @property
+    def db(self):
+        """serverlib.AsyncDB (preferred over dbfile)"""
+        return self.master.db
+
     @property
     def dbfile(self):
         return self.master.dbfile
+
+    @property
+    def readpool(self):
+        """serverlib.ReadPool or None"""
+        return self.master.readpool
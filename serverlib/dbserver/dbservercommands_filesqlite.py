@@ -1,18 +1,32 @@
 __all__ = ["DBServerCommands_FileSQLite"]
 
 
-import serverlib as sl, a107
+import serverlib as sl, a107, time
+from dataclasses import dataclass
 from serverlib import is_command
 from .dbservercommands import *
 
 
 class DBServerCommands_FileSQLite(DBServerCommands):
-    """"Low-level" access to FileSQLite object."""
+    """"Low-level" access to FileSQLite object.
+
+    Read-only commands get_lod(), get_scalar(), get_singlecolumn() and show_tables() run on the server's read-only
+    connections if there are any (see DBServer, "numreaders" argument).
+
+    Large results can be streamed through server-side cursors: open_cursor(), then fetch_next() until it returns fewer
+    rows than requested (see also CursorClient).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # {cursorid: _OpenCursor, ...}
+        self.__cursors = {}
+        self.__lastcursorid = 0
 
     @is_command
     async def commit(self):
         """Commits the current transaction."""
-        self.dbfile.commit()
+        await self.db.commit()
 
     @is_command
     async def execute(self, statement, bindings=(), rowformat="dict", flag_commit=False):
@@ -21,17 +35,74 @@ class DBServerCommands_FileSQLite(DBServerCommands):
         Args:
             statement: SQLite statement
             bindings: statement bindings
-            rowformat: "row" (default) / "list" (converts to list of lists) / "dict" (converts to list of dicts)
+            rowformat: "list" (converts to list of lists) / "dict" (default; converts to list of dicts) / "columns"
+                       (converts to {columnname: column, ...}; see _format_cursor())
             flag_commit: whether to commit after executing statement
 
         Returns:
             list of rows
+
+        The whole result is built in memory and sent at once; see open_cursor() for large results.
         """
-        cursor = self.dbfile.execute(statement, bindings)
         if flag_commit:
-            self.dbfile.commit()
+            async with self.db.transaction():
+                cursor = await self.db.execute(statement, bindings)
+        else:
+            cursor = await self.db.execute(statement, bindings)
         return _format_cursor(cursor, rowformat)
 
+    @is_command
+    async def open_cursor(self, statement, bindings=(), rowformat="list"):
+        """Executes statement and keeps its cursor open on the server, so that rows can be fetched in chunks.
+
+        Args:
+            statement: SQLite statement
+            bindings: statement bindings
+            rowformat: "list" (default) / "dict" / "columns" (each chunk is a {columnname: column, ...} dict)
+
+        Returns:
+            cursorid, to be passed to fetch_next() and close_cursor()
+        """
+        if rowformat not in ("list", "dict", "columns"):
+            raise ValueError(f"Invalid row format: {rowformat}")
+        await self.__close_expired_cursors()
+        if len(self.__cursors) >= sl.config.maxcursors:
+            raise RuntimeError(f"Too many open cursors ({len(self.__cursors)})")
+        cursor = await self.db.run(self.dbfile.execute, statement, bindings)
+        self.__lastcursorid += 1
+        self.__cursors[self.__lastcursorid] = _OpenCursor(cursor, rowformat, time.time())
+        return self.__lastcursorid
+
+    @is_command
+    async def fetch_next(self, cursorid, size=None):
+        """Fetches next rows from cursor opened with open_cursor().
+
+        Args:
+            cursorid: returned by open_cursor()
+            size: maximum number of rows (defaults to serverlib.config.cursorchunksize)
+
+        Returns:
+            list of rows. When fewer than size rows are returned, the cursor is exhausted and has been closed
+        """
+        cursorid = int(cursorid)
+        size = sl.config.cursorchunksize if size is None else int(size)
+        try:
+            opencursor = self.__cursors[cursorid]
+        except KeyError:
+            raise ValueError(f"Invalid cursor id: {cursorid} (cursor may have expired)")
+        opencursor.lasttime = time.time()
+        rows = await self.db.run(opencursor.cursor.fetchmany, size)
+        if len(rows) < size:
+            await self.close_cursor(cursorid)
+        return _format_cursor(rows, opencursor.rowformat, opencursor.cursor.description)
+
+    @is_command
+    async def close_cursor(self, cursorid):
+        """Closes cursor opened with open_cursor() (no error if already closed)."""
+        opencursor = self.__cursors.pop(int(cursorid), None)
+        if opencursor is not None:
+            await self.db.run(opencursor.cursor.close)
+
     @is_command
     async def executemany(self, statement, bindings=(), flag_commit=False):
         """Executes SQLite statement repeatedly for each row in bindings.
@@ -43,23 +114,39 @@ class DBServerCommands_FileSQLite(DBServerCommands):
         Returns:
             list of rows
         """
-        self.dbfile.executemany(statement, bindings)
-        if flag_commit: self.dbfile.commit()
+        if flag_commit:
+            async with self.db.transaction():
+                await self.db.executemany(statement, bindings)
+        else:
+            await self.db.executemany(statement, bindings)
 
     @is_command
-    async def get_scalar(self, *args, **kwargs):
+    async def get_lod(self, statement, bindings=()):
+        """Executes statement and returns list of dicts."""
+        if self.readpool:
+            return await self.readpool.get_lod(statement, bindings)
+        return await self.db.get_lod(statement, bindings)
+
+    @is_command
+    async def get_scalar(self, statement, bindings=()):
         """Executes statement that presumably fetches one row containing one column."""
-        return self.dbfile.get_scalar(*args, **kwargs)
+        if self.readpool:
+            return await self.readpool.get_scalar(statement, bindings)
+        return await self.db.get_scalar(statement, bindings)
 
     @is_command
-    async def get_singlecolumn(self, *args, **kwargs):
+    async def get_singlecolumn(self, statement, bindings=()):
         """Executes statement that presumably feches one column per row."""
-        return self.dbfile.get_singlecolumn(*args, **kwargs)
+        if self.readpool:
+            return await self.readpool.get_singlecolumn(statement, bindings)
+        return await self.db.get_singlecolumn(statement, bindings)
 
     @is_command
     async def get_singlerow(self, statement, bindings=(), rowformat="dict"):
         """Executes statement that presumably feches one row only. **Does** raise if rowcount != 1"""
-        _ret = self.dbfile.execute(statement, bindings).fetchall()
+        if rowformat == "columns":
+            raise ValueError("Row format 'columns' is not accepted for a single row")
+        _ret = (await self.db.execute(statement, bindings)).fetchall()
         if len(_ret) != 1:
             raise ValueError(f"Statement must produce number of rows ==1, not {len(_ret)}")
         ret = _format_cursor(_ret, rowformat)[0]
@@ -68,26 +155,92 @@ class DBServerCommands_FileSQLite(DBServerCommands):
     @is_command
     async def describe(self, tablename, rowformat="dict"):
         """Making up for the lack of SQL "describe" command."""
-        return _format_cursor(self.dbfile.describe(tablename), rowformat)
+        return _format_cursor(await self.db.describe(tablename), rowformat)
 
     @is_command
     async def show_tables(self, rowformat="dict"):
         """Making up for the lack of SQL "show tables" statement."""
-        return _format_cursor(self.dbfile.show_tables(), rowformat)
+        if self.readpool:
+            return _format_cursor(await self.readpool.show_tables(), rowformat)
+        return _format_cursor(await self.db.show_tables(), rowformat)
 
     @is_command
     async def create_database(self, flag_overwrite=False):
         """Creates database if it does not exist or if forced overwriting. **Careful**"""
         flag_overwrite = a107.to_bool(flag_overwrite)
-        self.dbfile.create_database(flag_overwrite=flag_overwrite)
-
-
-
-def _format_cursor(cursor, rowformat):
-    if rowformat == "list":
+        await self.db.create_database(flag_overwrite=flag_overwrite)
+
+    # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    # PRIVATE
+
+    async def __close_expired_cursors(self):
+        limit = time.time()-sl.config.cursortimeout
+        for cursorid in [cursorid for cursorid, opencursor in self.__cursors.items() if opencursor.lasttime < limit]:
+            self.logger.debug(f"Closing expired cursor #{cursorid}")
+            await self.close_cursor(cursorid)
+
+
+@dataclass
+class _OpenCursor:
+    cursor: object
+    rowformat: str
+    lasttime: float
+
+
+
+def _format_cursor(cursor, rowformat, description=None):
+    """Converts rows to rowformat.
+
+    Args:
+        cursor: cursor or list of rows
+        rowformat: "list" / "dict" / "columns"
+        description: cursor description to get column names from, if cursor is a list (only needed for "columns")
+
+    Format "columns" gives {columnname: column, ...}, where each column is a NumPy array if the column is numeric and
+    NumPy is installed (integer columns without NULLs --> int64; other numeric columns --> float64 with NaN for NULL),
+    or a list otherwise. This is much more compact than "dict" on the wire.
+    """
+    if rowformat == "columns":
+        if description is None:
+            description = getattr(cursor, "description", None)
+        rows = list(cursor)
+        if description is not None:
+            names = [item[0] for item in description]
+        else:
+            names = list(rows[0].keys()) if rows else []
+        return {name: _make_column([row[i] for row in rows]) for i, name in enumerate(names)}
+    elif rowformat == "list":
         ret = [list(row) for row in cursor]
     elif rowformat == "dict":
         ret = [dict(row) for row in cursor]
     else:
         raise ValueError(f"Invalid row format: {rowformat}")
     return ret
+
+
+def _make_column(values):
+    """Converts list of values to NumPy array if possible (see _format_cursor())."""
+    try:
+        import numpy as np
+    except ImportError:
+        return values
+    if not values:
+        return values
+    flag_float = False
+    flag_none = False
+    for value in values:
+        if value is None:
+            flag_none = True
+        elif isinstance(value, float):
+            flag_float = True
+        elif not isinstance(value, int) or isinstance(value, bool):
+            return values
+    if flag_float:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if flag_none:
+        # integers with NULLs are kept as they are
+        return values
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:
+        return values
@@ -0,0 +1,92 @@
+__all__ = ["ReadPool"]
+
+import asyncio, sqlite3, threading, pathlib, a107
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReadPool:
+    """Read-only SQLite connections used from worker threads, so that long reads do not block the event loop.
+
+    Args:
+        path: path to SQLite database file
+        numreaders: number of worker threads (each one opens its own connection upon first use)
+        pragmas: {pragmaname: value, ...} to set on each connection
+
+    Readers only see committed data. Concurrent reading and writing works best with journal_mode "wal"; otherwise,
+    readers and the writer block one another (see DBServer).
+    """
+
+    def __init__(self, path, numreaders, pragmas=None):
+        self.path = path
+        self.numreaders = numreaders
+        self.pragmas = pragmas if pragmas is not None else {}
+        self.__executor = ThreadPoolExecutor(max_workers=numreaders, thread_name_prefix="dbreader")
+        self.__local = threading.local()
+        self.__conns = []
+        self.__lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """Runs fn(conn, *args) in a worker thread and returns its result. conn is a sqlite3.Connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__call, fn, args)
+
+    async def get_lod(self, statement, bindings=()):
+        """Returns list of dicts."""
+        return await self.run(_get_lod, statement, bindings)
+
+    async def get_scalar(self, statement, bindings=()):
+        """Returns first column of first row."""
+        return await self.run(_get_scalar, statement, bindings)
+
+    async def get_singlecolumn(self, statement, bindings=()):
+        """Returns list containing the first column of each row."""
+        return await self.run(_get_singlecolumn, statement, bindings)
+
+    async def show_tables(self):
+        """Returns list of sqlite3.Row for the tables in the database."""
+        return await self.run(_show_tables)
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
+        with self.__lock:
+            for conn in self.__conns:
+                conn.close()
+            self.__conns.clear()
+
+    # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    # PRIVATE
+
+    def __call(self, fn, args):
+        return fn(self.__get_conn(), *args)
+
+    def __get_conn(self):
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            uri = pathlib.Path(self.path).absolute().as_uri()+"?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for name, value in self.pragmas.items():
+                conn.execute(f"pragma {name}={value}")
+            self.__local.conn = conn
+            with self.__lock:
+                self.__conns.append(conn)
+        return conn
+
+
+def _get_lod(conn, statement, bindings):
+    return [dict(row) for row in conn.execute(statement, bindings)]
+
+
+def _get_scalar(conn, statement, bindings):
+    row = conn.execute(statement, bindings).fetchone()
+    if row is None:
+        raise a107.NoData("Statement produced no rows")
+    return row[0]
+
+
+def _get_singlecolumn(conn, statement, bindings):
+    return [row[0] for row in conn.execute(statement, bindings)]
+
+
+def _show_tables(conn):
+    return conn.execute("select * from sqlite_master where type='table'").fetchall()
@@ -1,3 +1,9 @@
+__all__ = ["lowstate", "acquire_context", "release_context"]
+
+import asyncio, zmq, zmq.asyncio
+from .config import config
+
+
 class lowstate:
     """
     Low-level server state
@@ -8,4 +14,55 @@ class lowstate:
     # Number of ZMQ sockets. DO NOT CHANGE!
     numsockets = 0
     # Number of ZMQ contexts. DO NOT CHANGE!
-    numcontexts = 0
\ No newline at end of file
+    numcontexts = 0
+    # Number of references to the shared ZMQ contexts (see acquire_context()). DO NOT CHANGE!
+    numcontextrefs = 0
+    # Number of log records dropped because the logging queue was full (see config.logging.queuepolicy)
+    numlogdropped = 0
+    # Number of messages dropped because a Publisher queue was full (see Publisher policy)
+    numpubdropped = 0
+    # Number of messages lost because a Publisher failed to send them (queue mode)
+    numpubfailed = 0
+
+
+# Shared ZMQ contexts: {event loop: [context, number of references], ...}
+_contexts = {}
+
+
+def acquire_context():
+    """Returns the ZMQ context shared within the process and running event loop, creating it if needed.
+
+    Every ZMQ context starts its own I/O thread(s) (config.io_threads), so clients, servers, publishers and subscribers
+    use this instead of creating their own contexts. Every call must be matched by a release_context() call.
+    """
+    key = _get_loop()
+    entry = _contexts.get(key)
+    if entry is None:
+        entry = _contexts[key] = [zmq.asyncio.Context(io_threads=config.io_threads), 0]
+        lowstate.numcontexts += 1
+    entry[1] += 1
+    lowstate.numcontextrefs += 1
+    return entry[0]
+
+
+def release_context(context):
+    """Releases reference to context obtained with acquire_context(). Context is destroyed on its last release."""
+    for key, entry in _contexts.items():
+        if entry[0] is context:
+            break
+    else:
+        raise ValueError("Context was not obtained with acquire_context() or has already been destroyed")
+    entry[1] -= 1
+    lowstate.numcontextrefs -= 1
+    if entry[1] == 0:
+        del _contexts[key]
+        context.destroy()
+        lowstate.numcontexts -= 1
+
+
+def _get_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        # e.g. Subscriber instantiated outside a coroutine
+        return None
@@ -0,0 +1,197 @@
+"""Per-command server metrics (see Server.metrics and server command "getd_metrics")."""
+
+__all__ = ["ServerMetrics", "CommandMetrics", "Histogram"]
+
+import bisect, random, time
+
+# Phases of statement handling timed by the server
+PHASES = ("parse", "execute", "serialize", "send")
+
+# Default histogram bucket upper bounds (seconds)
+DEFAULTBOUNDS = (.00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+
+class Histogram:
+    """Histogram with fixed buckets.
+
+    Args:
+        bounds: sorted sequence of bucket upper bounds; values above the last bound fall into an extra "+Inf" bucket
+    """
+
+    def __init__(self, bounds=DEFAULTBOUNDS):
+        self.bounds = tuple(bounds)
+        # non-cumulative counts, one per bucket, plus "+Inf"
+        self.counts = [0]*(len(self.bounds)+1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Returns upper bound of the bucket containing quantile q (0 <= q <= 1), or None if there are no values.
+
+        Returns float("inf") if quantile falls beyond the last bound.
+        """
+        if self.count == 0:
+            return None
+        target = q*self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {"count": self.count,
+                "sum": self.sum,
+                "mean": self.sum/self.count if self.count else None,
+                "p50": self.quantile(.5),
+                "p99": self.quantile(.99),
+                "buckets": dict(zip(self.bounds+(float("inf"),), self.counts))}
+
+
+class CommandMetrics:
+    """Counters and phase histograms for one command."""
+
+    def __init__(self):
+        # number of executions
+        self.numcalls = 0
+        # number of executions that resulted in exception
+        self.numerrors = 0
+        # number of executions going on
+        self.inflight = 0
+        # {phase: Histogram, ...} (see PHASES), fed by sampled statements only
+        self.histograms = {phase: Histogram() for phase in PHASES}
+
+    def to_dict(self, flag_histograms=True):
+        ret = {"numcalls": self.numcalls, "numerrors": self.numerrors, "inflight": self.inflight}
+        if flag_histograms:
+            ret["histograms"] = {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}
+        return ret
+
+
+class Sample:
+    """Phase timings of one statement; see ServerMetrics.new_sample()."""
+
+    __slots__ = ("command", "times", "last")
+
+    def __init__(self):
+        # CommandMetrics, set once the command is known. Samples of rejected statements are not recorded
+        self.command = None
+        # {phase: seconds, ...}
+        self.times = {}
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Records time elapsed since previous mark (or creation) as the duration of phase."""
+        now = time.perf_counter()
+        self.times[phase] = now-self.last
+        self.last = now
+
+
+class ServerMetrics:
+    """Per-command metrics of a server.
+
+    Args:
+        sampling: fraction of statements whose phases are timed (0: none; 1: all)
+
+    Counters (calls, errors, in-flight) are always kept, as they cost a few integer operations per statement; timing is
+    limited to sampled statements.
+    """
+
+    def __init__(self, sampling=0.):
+        self.sampling = sampling
+        # {commandname: CommandMetrics, ...}
+        self.commands = {}
+        # number of statements rejected before execution (non-existing command, bad data, etc.)
+        self.numrejected = 0
+        self.starttime = time.time()
+
+    def get_command(self, commandname):
+        """Returns CommandMetrics for commandname, creating it if needed."""
+        ret = self.commands.get(commandname)
+        if ret is None:
+            ret = self.commands[commandname] = CommandMetrics()
+        return ret
+
+    def new_sample(self):
+        """Returns new Sample if statement about to be handled is to be timed, otherwise None."""
+        sampling = self.sampling
+        if sampling and (sampling >= 1 or random.random() < sampling):
+            return Sample()
+        return None
+
+    def record(self, sample):
+        """Feeds sample timings into the histograms of its command."""
+        if sample.command is not None:
+            histograms = sample.command.histograms
+            for phase, seconds in sample.times.items():
+                histograms[phase].observe(seconds)
+
+    def reset(self):
+        """Zeroes all metrics (in-flight counts are kept)."""
+        for commandname, metrics in list(self.commands.items()):
+            if metrics.inflight:
+                # zeroed in place, as the server holds this object until execution finishes
+                metrics.numcalls = metrics.numerrors = 0
+                metrics.histograms = {phase: Histogram() for phase in PHASES}
+            else:
+                del self.commands[commandname]
+        self.numrejected = 0
+        self.starttime = time.time()
+
+    def to_dict(self, flag_histograms=True):
+        return {"sampling": self.sampling,
+                "starttime": self.starttime,
+                "numrejected": self.numrejected,
+                "commands": {commandname: metrics.to_dict(flag_histograms)
+                             for commandname, metrics in sorted(self.commands.items())}}
+
+    def to_prometheus(self, labels=None, prefix="serverlib"):
+        """Returns metrics in the Prometheus text exposition format.
+
+        Args:
+            labels: {name: value, ...} added to all samples (e.g. {"server": subappname})
+            prefix: metric name prefix
+        """
+        base = "".join(f'{name}="{_escape(value)}",' for name, value in (labels or {}).items())
+        lines = []
+
+        def add_header(name, type_, help_):
+            lines.append(f"# HELP {prefix}_{name} {help_}")
+            lines.append(f"# TYPE {prefix}_{name} {type_}")
+
+        add_header("statements_rejected_total", "counter", "Statements rejected before execution")
+        rejectedlabels = f"{{{base.rstrip(',')}}}" if base else ""
+        lines.append(f"{prefix}_statements_rejected_total{rejectedlabels} {self.numrejected}")
+        items = sorted(self.commands.items())
+        for name, attrname, type_, help_ in (("commands_total", "numcalls", "counter", "Commands executed"),
+                                             ("command_errors_total", "numerrors", "counter",
+                                              "Commands that resulted in exception"),
+                                             ("commands_inflight", "inflight", "gauge", "Commands being executed")):
+            add_header(name, type_, help_)
+            for commandname, metrics in items:
+                lines.append(f'{prefix}_{name}{{{base}command="{_escape(commandname)}"}} '
+                             f'{getattr(metrics, attrname)}')
+        add_header("command_phase_seconds", "histogram", "Duration of statement handling phases (sampled)")
+        for commandname, metrics in items:
+            for phase, histogram in metrics.histograms.items():
+                if not histogram.count:
+                    continue
+                plabels = f'{base}command="{_escape(commandname)}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds+(float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_command_phase_seconds_bucket{{{plabels},le="{le}"}} {cumulative}')
+                lines.append(f"{prefix}_command_phase_seconds_sum{{{plabels}}} {histogram.sum}")
+                lines.append(f"{prefix}_command_phase_seconds_count{{{plabels}}} {histogram.count}")
+        return "\n".join(lines)+"\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -36,6 +36,12 @@ def print_result(ret, logger, flag_colors=True):
                 handle_default(arg)
 
         def handle_dict(arg):
+            if _is_columns(arg):
+                # e.g. query result with rowformat="columns"
+                header = list(arg.keys())
+                rows = [list(row) for row in zip(*[_column2list(column) for column in arg.values()])]
+                print_tabulated(_powertabulate(rows, header, logger))
+                return
             rich.print(arg)
             # if len(arg) > 0:
             #     # 20230827 Limiting recursive resolution to first level
@@ -136,6 +142,23 @@ def _powertabulate(rows, header, logger, *args, **kwargs):
 
 
 
+def _is_columns(arg):
+    """Detects {columnname: column, ...} dict whose columns are lists or 1-D arrays with the same length."""
+    if not arg:
+        return False
+    lengths = set()
+    for column in arg.values():
+        if isinstance(column, list) or getattr(column, "ndim", None) == 1:
+            lengths.add(len(column))
+        else:
+            return False
+    return len(lengths) == 1
+
+
+def _column2list(column):
+    return column.tolist() if hasattr(column, "tolist") else column
+
+
 def _detect_girafales(s):
     lines = s.split("\n")
     return any(line.startswith("-") and line.count("-") > len(line)/2 for line in lines)
@@ -1,6 +1,6 @@
 __all__ = ["subscriber", "Publisher", "Subscriber"]
 
-import zmq, zmq.asyncio, serverlib as sl, a107, asyncio
+import zmq, zmq.asyncio, serverlib as sl, a107, asyncio, logging, collections
 from colored import fg, bg, attr
 
 
@@ -14,29 +14,109 @@ def print_wow(*args):
     print(format_wow(*args))
 
 
+# Debug messages built for each message published/received, only if debug logging is enabled (see sl.log_lazy())
+
+def _format_publishing(msg):
+    try:
+        return f"PPPPPPPPPPPPPPPPPublishing '{msg.decode()}'"
+    except UnicodeDecodeError:
+        return "PPPPPPPPPPPPPPPPPublishing sth; unfortumately IT CAN'T BE SHOWN HERE BECAUSE THERE ARE CHILDREN WATCHING!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
+
+
+def _format_received(msg):
+    return format_wow(f":) Received command '{msg.partition(b' ')[0].decode(errors='replace')}'")
+
+
 class Publisher(sl.Intelligence):
-    """Allows access to a 0MQ "pub" socket. publish() expects bytes."""
-    def __init__(self, master, hopo):
+    """Allows access to a 0MQ "pub" socket. publish() expects bytes.
+
+    Args:
+        master: see serverlib.Intelligence
+        hopo: port or (host, port)
+        flag_queue: whether publish() only enqueues message, to be sent by a single sender task. Messages are sent
+                    one by one, as subscribers filter on the first frame of each message
+        queuesize: maximum number of messages waiting to be sent (queue mode only)
+        policy: what publish() does when queue is full: "block" (waits for room); "drop_oldest" (discards oldest
+                message waiting); "drop_newest" (discards message being published). See numdropped
+        batchsize: maximum number of messages sent in a row before other tasks get a chance to run (queue mode only)
+        sndhwm: 0MQ send high water mark (messages queued by 0MQ for each subscriber before it starts dropping them).
+                None keeps 0MQ default
+        flag_conflate: whether 0MQ keeps only the last message for each subscriber (0MQ CONFLATE option)
+        closetimeout: maximum time close() waits for queued messages to be sent (seconds; queue mode only)
+
+    Messages dropped because the queue was full, or lost because sending failed, are also counted process-wide in
+    lowstate.numpubdropped and lowstate.numpubfailed (see server command "getd_lowstate").
+    """
+
+    POLICIES = ("block", "drop_oldest", "drop_newest")
+
+    @property
+    def stats(self):
+        """Returns {"numpublished", "numsent", "numdropped", "numfailed", "numqueued"}."""
+        return {"numpublished": self.numpublished,
+                "numsent": self.numsent,
+                "numdropped": self.numdropped,
+                "numfailed": self.numfailed,
+                "numqueued": len(self.__queue)}
+
+    def __init__(self, master, hopo, flag_queue=False, queuesize=10000, policy="block", batchsize=256, sndhwm=None,
+                 flag_conflate=False, closetimeout=5.):
         super().__init__(master)
+        if policy not in self.POLICIES:
+            raise ValueError(f"Invalid policy: '{policy}' (possibilities: {self.POLICIES})")
         self.hopo = hopo
+        self.flag_queue = flag_queue
+        self.queuesize = queuesize
+        self.policy = policy
+        self.batchsize = batchsize
+        self.sndhwm = sndhwm
+        self.flag_conflate = flag_conflate
+        self.closetimeout = closetimeout
+        # number of publish() calls; messages actually sent; messages discarded because queue was full; messages lost
+        # because sending failed
+        self.numpublished = 0
+        self.numsent = 0
+        self.numdropped = 0
+        self.numfailed = 0
         self.__lock = asyncio.Lock()
+        # queue mode: messages waiting to be sent, sender task and its signals
+        self.__queue = collections.deque()
+        self.__sender = None
+        self.__nonempty = asyncio.Event()
+        self.__room = asyncio.Event()
+        self.__idle = asyncio.Event()
+        self.__idle.set()
 
     async def _on_initialize(self):
-        self.context = zmq.asyncio.Context()
-        sl.lowstate.numcontexts += 1
+        self.context = sl.acquire_context()
         self.socket = self.context.socket(zmq.PUB)
         sl.lowstate.numsockets += 1
+        if self.sndhwm is not None:
+            self.socket.setsockopt(zmq.SNDHWM, self.sndhwm)
+        if self.flag_conflate:
+            self.socket.setsockopt(zmq.CONFLATE, 1)
         url = sl.hopo2url(self.hopo, "*")
         logmsg = f"Binding socket (PUB) to {url} ..."
         self.logger.info(logmsg)
         self.socket.bind(url)
+        if self.flag_queue:
+            self.__sender = asyncio.create_task(self.__send_loop(), name="publisher")
 
     async def _on_close(self):
         self.logger.debug("Closing PUB server <<<<<<<<<<<<<<<<<<")
+        if self.__sender is not None:
+            try:
+                if not self.__sender.done():
+                    await asyncio.wait_for(self.flush(), self.closetimeout)
+            except (asyncio.TimeoutError, RuntimeError) as e:
+                self.logger.warning(f"Discarding {len(self.__queue)} queued message(s) upon close: {a107.str_exc(e)}")
+            finally:
+                self.__sender.cancel()
+                await asyncio.gather(self.__sender, return_exceptions=True)
+                self.__sender = None
         self.socket.close()
         sl.lowstate.numsockets -= 1
-        self.context.destroy()
-        sl.lowstate.numcontexts -= 1
+        sl.release_context(self.context)
 
     async def publish(self, msg):
         """Publishes message.
@@ -44,18 +124,88 @@ class Publisher(sl.Intelligence):
         Args:
             msg: bytes or str
 
-        This routine uses a lock in order to allow a single publisher to be shared by several concurrent tasks
+        This routine allows a single publisher to be shared by several concurrent tasks (using a lock, or the queue in
+        queue mode). In queue mode, raises RuntimeError if the sender task is not running
         """
 
+        if self.flag_queue:
+            self.__check_sender()
         if isinstance(msg, str): msg = msg.encode()
+        self.numpublished += 1
 
-        try:
-            self.logger.debug(f"PPPPPPPPPPPPPPPPPublishing '{msg.decode()}'")
-        except UnicodeDecodeError:
-            self.logger.debug(f"PPPPPPPPPPPPPPPPPublishing sth; unfortumately IT CAN'T BE SHOWN HERE BECAUSE THERE ARE CHILDREN WATCHING!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
+        sl.log_lazy(self.logger, logging.DEBUG, _format_publishing, msg)
+
+        if self.flag_queue:
+            await self.__enqueue(msg)
+            return
 
         async with self.__lock:
             await self.socket.send(msg)
+        self.numsent += 1
+
+    async def flush(self):
+        """Waits until all queued messages are sent (queue mode only). Raises RuntimeError if sender is not running."""
+        while self.__queue or not self.__idle.is_set():
+            self.__check_sender()
+            await self.__idle.wait()
+        self.__check_sender()
+
+    # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    # PRIVATE
+
+    def __check_sender(self):
+        if self.__sender is None or self.__sender.done():
+            raise RuntimeError("Publisher sender task is not running")
+
+    async def __enqueue(self, msg):
+        queue = self.__queue
+        if len(queue) >= self.queuesize:
+            if self.policy == "drop_newest":
+                self.numdropped += 1
+                sl.lowstate.numpubdropped += 1
+                return
+            elif self.policy == "drop_oldest":
+                queue.popleft()
+                self.numdropped += 1
+                sl.lowstate.numpubdropped += 1
+            else:
+                while len(queue) >= self.queuesize:
+                    self.__room.clear()
+                    await self.__room.wait()
+                    self.__check_sender()
+        queue.append(msg)
+        self.__idle.clear()
+        self.__nonempty.set()
+
+    async def __send_loop(self):
+        queue, socket, batchsize = self.__queue, self.socket, self.batchsize
+        try:
+            while True:
+                if not queue:
+                    self.__idle.set()
+                    self.__nonempty.clear()
+                    await self.__nonempty.wait()
+                    continue
+                # One message per send: multipart would make subscribers filter the whole batch on the first one
+                n = 0
+                while queue and n < batchsize:
+                    msg = queue.popleft()
+                    n += 1
+                    try:
+                        await socket.send(msg, zmq.NOBLOCK)
+                    except zmq.ZMQError:
+                        self.numfailed += 1
+                        sl.lowstate.numpubfailed += 1
+                        self.logger.exception("Error sending message; it is lost")
+                    else:
+                        self.numsent += 1
+                self.__room.set()
+                # PUB sends do not block, so gives publishers a chance to run
+                await asyncio.sleep(0)
+        finally:
+            # wakes up whoever is waiting on me, so that they find out that I am gone (see __check_sender())
+            self.__idle.set()
+            self.__room.set()
 
 
 async def subscriber(hopos, topics, logger=None):
@@ -72,8 +222,9 @@ async def subscriber(hopos, topics, logger=None):
     logger.debug(format_wow("subscriber() is alive"))
     if isinstance(hopos, (int, str)):
         hopos = [hopos]
-    context = zmq.asyncio.Context()
+    context = sl.acquire_context()
     socket = context.socket(zmq.SUB)
+    sl.lowstate.numsockets += 1
     try:
         for hopo in hopos:
             url = sl.hopo2url(hopo)
@@ -84,21 +235,14 @@ async def subscriber(hopos, topics, logger=None):
             logger.debug(format_wow(f"Subscribing to '{topic}'"))
             socket.setsockopt(zmq.SUBSCRIBE, topic)
         while True:
-            logger.debug(format_wow("Waiting for message..."))
+            sl.log_lazy(logger, logging.DEBUG, format_wow, "Waiting for message...")
             msg = await socket.recv()
-
-            # debug
-            try:
-                i0 = msg.index(b" ")
-                msg_ = msg[:i0].decode()
-            except ValueError:
-                msg_ = msg.decode()
-            logger.debug(format_wow(f":) Received command '{msg_}'"))
-
+            sl.log_lazy(logger, logging.DEBUG, _format_received, msg)
             yield msg
     finally:
         socket.close()
-        context.destroy()
+        sl.lowstate.numsockets -= 1
+        sl.release_context(context)
         logger.debug(format_wow("subscriber() says bye"))
 
 
@@ -127,7 +271,7 @@ class Subscriber:
         self.logger = logger
         logger.debug(format_wow("subscriber() is alive"))
 
-        self.context = zmq.asyncio.Context()
+        self.context = sl.acquire_context()
         self.socket = self.context.socket(zmq.SUB)
         sl.lowstate.numsockets += 1
 
@@ -174,14 +318,14 @@ class Subscriber:
     async def close(self):
         self.socket.close()
         sl.lowstate.numsockets -= 1
-        self.context.destroy()
+        sl.release_context(self.context)
         self.logger.debug(format_wow("subscriber() says bye"))
 
     async def agenerator(self):
         logger = self.logger
         logger.debug(format_wow("subscriber() is alive"))
         while not self.__flag_stop:
-            logger.debug(format_wow("Waiting for message..."))
+            sl.log_lazy(logger, logging.DEBUG, format_wow, "Waiting for message...")
             msg = await self.socket.recv()
-            logger.debug(format_wow(f":) Received '{msg[:msg.index(b' ')].decode()} ...'"))
+            sl.log_lazy(logger, logging.DEBUG, _format_received, msg)
             yield msg
@@ -0,0 +1,113 @@
+"""
+Wire serializers
+
+Client and server agree on a serializer when the client initializes (see ClientCfg.serializer and
+ServerCfg.serializers). Register new serializers with register_serializer().
+"""
+
+__all__ = ["Serializer", "PickleSerializer", "MsgpackSerializer", "RawSerializer", "serializers",
+           "register_serializer", "get_serializer"]
+
+import pickle
+
+
+class Serializer:
+    """Base class for wire serializers
+
+    Descendants must define "name" and implement dumps() and loads().
+    """
+
+    # name by which the serializer is identified in configuration and in statements sent through the wire
+    name = None
+
+    def is_available(self):
+        """Returns whether the serializer can be used (e.g., third-party package is installed)."""
+        return True
+
+    def dumps(self, obj):
+        """obj --> bytes"""
+        raise NotImplementedError()
+
+    def loads(self, b):
+        """bytes --> obj"""
+        raise NotImplementedError()
+
+
+class PickleSerializer(Serializer):
+    """Default serializer, able to handle any picklable object."""
+
+    name = "pickle"
+
+    def dumps(self, obj):
+        return pickle.dumps(obj)
+
+    def loads(self, b):
+        return pickle.loads(b)
+
+
+class MsgpackSerializer(Serializer):
+    """Compact and fast for lists, dicts, strings and numbers. Requires the "msgpack" package.
+
+    **Note** tuples are received as lists.
+    """
+
+    name = "msgpack"
+
+    def is_available(self):
+        try:
+            self.__get_msgpack()
+        except ImportError:
+            return False
+        return True
+
+    def dumps(self, obj):
+        return self.__get_msgpack().packb(obj, use_bin_type=True)
+
+    def loads(self, b):
+        return self.__get_msgpack().unpackb(b, raw=False, strict_map_key=False)
+
+    @staticmethod
+    def __get_msgpack():
+        import msgpack
+        return msgpack
+
+
+class RawSerializer(Serializer):
+    """Passes bytes-like objects through; anything else is rejected
+
+    Useful to talk to commands that accept bytes (see MetaCommand.flag_bargs) and return bytes. Not a session
+    serializer: Client uses it per call, for a single bytes-like argument sent to a "bargs" command.
+    """
+
+    name = "raw"
+
+    def dumps(self, obj):
+        if not isinstance(obj, (bytes, bytearray, memoryview)):
+            raise TypeError(f"Serializer '{self.name}' needs a bytes-like object, not {obj.__class__.__name__}")
+        return bytes(obj)
+
+    def loads(self, b):
+        return b
+
+
+# {name: Serializer, ...}
+serializers = {}
+
+
+def register_serializer(serializer):
+    """Registers Serializer instance, possibly replacing one with the same name."""
+    if not isinstance(serializer, Serializer):
+        raise TypeError(f"I need a serverlib.Serializer, not {serializer.__class__.__name__}")
+    serializers[serializer.name] = serializer
+
+
+def get_serializer(name):
+    """Returns registered serializer (raises ValueError if not found)."""
+    try:
+        return serializers[name]
+    except KeyError:
+        raise ValueError(f"Unknown serializer: '{name}' (registered serializers are {list(serializers)})")
+
+
+for _serializer in (PickleSerializer(), MsgpackSerializer(), RawSerializer()):
+    register_serializer(_serializer)
@@ -3,7 +3,7 @@
 __all__ = ["Server"]
 
 
-import pickle, signal, asyncio, a107, zmq, zmq.asyncio, serverlib as sl, traceback, random, inspect
+import signal, asyncio, a107, zmq, zmq.asyncio, serverlib as sl, traceback, random, inspect
 from colored import attr
 from dataclasses import dataclass
 from typing import Any
@@ -43,6 +43,11 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
     def url(self):
         return sl.hopo2url((self.cfg.host, self.cfg.port))
 
+    @property
+    def metrics(self):
+        """serverlib.ServerMetrics"""
+        return self.__metrics
+
     def __init__(self, cfg, description=None, cmd=None, subservers=None):
         assert issubclass(cfg, sl.ServerCfg)
 
@@ -53,7 +58,12 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
 
         self.__state = ServerState.INIT
         self.__loops = None  # {methodname0: task0, ...}
+        # set when main loop is ready, releasing the other loops
+        self.__looping = None
         self.__subservers = _get_scpairs(subservers)
+        # number of statements received (see ServerCfg.commandlogevery)
+        self.__numstatements = 0
+        self.__metrics = sl.ServerMetrics(self.cfg.metricssampling)
         self.__state = ServerState.ALIVE
 
     # ──────────────────────────────────────────────────────────────────────────────────────────────────────────────────
@@ -146,8 +156,7 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
             try:
                 if not loopdata.is_mainloop:
                     # other loops wait until main loop is ready
-                    while self.state != ServerState.LOOP:
-                        await asyncio.sleep(0.01)
+                    await self.__looping.wait()
                 return await awaitable
             except asyncio.CancelledError:
                 raise
@@ -176,6 +185,7 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
             return loopdata
 
         # === CREATES LOOPDATA, INCLUDING ASYNC TASKS
+        self.__looping = asyncio.Event()
         self.__loops = []
         for method in [x[1] for x in inspect.getmembers(self, predicate=inspect.ismethod)
                        if hasattr(x[1], "is_loop") and x[1].is_loop]:
@@ -204,30 +214,36 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
 
     @sl.is_loop
     async def __mainloop(self):
-        async def execute_command(method, data):
-            """(callable, list) --> (result or exception) (only raises BaseException)."""
+        def parse_statement(frames):
+            """frames --> (commandname, has_data, data, command, serializer, trace, exception)
 
-            try:
-                if inspect.iscoroutinefunction(method):
-                    ret = await method(*data[0], **data[1])
-                else:
-                    ret = method(*data[0], **data[1])
-            except BaseException as e:
-                self.logger.exception(f"Error executing '{method.__name__}'")
-                ret = e
-            return ret
+            (list of memoryview) --> (str, bool, list, MetaCommand, Serializer/None, TraceContext/None,
+                                      StatementError/None)
 
-        def parse_statement(st):
-            """bytes --> (commandname, has_data, data, command, exception) (str, bool, bytes, callable, StatementError/None)."""
-            bdata, data, command, exception = b"", [], None, None
+            serializer is None for untagged statements (see serverlib._api.wire).
+            """
+            data, command, serializer, exception = [], None, None, None
             # Splits statement
-            try:
-                idx = st.index(b" ")
-            except ValueError:
-                commandname = st.decode()
+            if len(frames) == 1:
+                commandname, serializername, trace, bdata = _api.split_statement(bytes(frames[0]))
             else:
-                commandname, bdata = st[:idx].decode(), st[idx+1:]
+                # multipart: payload is kept as memoryview
+                commandname, serializername, trace, bdata = _api.split_statement_frames(frames)
             has_data = len(bdata) > 0
+            # Figures out serializer
+            if serializername is not None:
+                if serializername in self.cfg.serializers:
+                    try:
+                        serializer = sl.get_serializer(serializername)
+                    except ValueError as e:
+                        exception = sl.StatementError(str(e))
+                else:
+                    exception = sl.StatementError(f"Serializer not accepted by server: '{serializername}'")
+                if exception:
+                    # Client still expects a tagged reply
+                    serializer = sl.get_serializer("pickle")
+                    self.logger.info(str(exception))
+                    return commandname, has_data, data, command, serializer, trace, exception
             # Figures out method
             try:
                 command = self.metacommands[commandname]
@@ -236,38 +252,120 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
                 self.logger.info(message)
                 exception = sl.StatementError(message)
             else:
-                self.logger.info(f"$ {commandname}{' ...' if has_data else ''}")
+                logevery = self.cfg.commandlogevery
+                if logevery:
+                    self.__numstatements += 1
+                    loglevel = self.cfg.commandloglevel
+                    if self.__numstatements % logevery == 0 and self.logger.isEnabledFor(loglevel):
+                        self.logger.log(loglevel, f"$ {commandname}{' ...' if has_data else ''}")
             # Processes data
             if command:
-                data = [[], {}] if len(bdata) == 0 else [[bdata], {}] if command.flag_bargs else pickle.loads(bdata)
-                if not isinstance(data, list):
-                    exception = sl.StatementError(f"Data must unpickle to a [args, kwargs], not a {data.__class__.__name__}")
-                elif len(data) != 2 or type(data[0]) not in (list, tuple) or type(data[1]) != dict:
-                    exception = sl.StatementError("Data must unpickle to [args, kwargs]")
-            return commandname, has_data, data, command, exception
+                try:
+                    data = [[], {}] if len(bdata) == 0 else [[bdata], {}] if command.flag_bargs \
+                        else (serializer or pickleserializer).loads(bdata)
+                except Exception as e:
+                    exception = sl.StatementError(f"Error deserializing data: {a107.str_exc(e)}")
+                else:
+                    if not isinstance(data, list):
+                        exception = sl.StatementError(f"Data must deserialize to a [args, kwargs], "
+                                                      f"not a {data.__class__.__name__}")
+                    elif len(data) != 2 or type(data[0]) not in (list, tuple) or type(data[1]) != dict:
+                        exception = sl.StatementError("Data must deserialize to [args, kwargs]")
+                    else:
+                        try:
+                            command.check_arguments(*data)
+                        except TypeError as e:
+                            exception = sl.StatementError(f"Invalid arguments for '{commandname}': {e}")
+                            self.logger.info(str(exception))
+            return commandname, has_data, data, command, serializer, trace, exception
+
+        async def handle_statement(frames):
+            """frames --> (reply frames (serialized result, or serialized exception), metrics Sample or None)
+
+            Statement and reply are single-frame or multipart alike (see serverlib._api.wire).
+
+            If a sample is returned, the caller must mark the "send" phase and record the sample.
+            """
+            sample = metrics.new_sample()
+            commandname, has_data, data, command, serializer, trace, exception = parse_statement(frames)
+            if sample:
+                sample.mark("parse")
+            if exception:
+                metrics.numrejected += 1
+                result = exception
+            else:
+                cmdmetrics = metrics.get_command(commandname)
+                cmdmetrics.numcalls += 1
+                cmdmetrics.inflight += 1
+                if trace is None:
+                    result = await self._execute_command(command, *data)
+                else:
+                    # Span becomes the current trace context while executing command, so that it is logged and
+                    # propagated by clients used within command (e.g. towards subservers)
+                    with sl.span(f"{self.subappname}:{commandname}", parent=trace):
+                        result = await self._execute_command(command, *data)
+                cmdmetrics.inflight -= 1
+                if isinstance(result, BaseException):
+                    cmdmetrics.numerrors += 1
+                if sample:
+                    sample.command = cmdmetrics
+                    sample.mark("execute")
+
+            make_reply = _api.make_reply_frames if len(frames) > 1 else lambda *args: [_api.make_reply(*args)]
+            try:
+                msg = make_reply(result, serializer)
+            except BaseException as e:
+                self.logger.exception("Error serializing result")
+                # Sends exception to client instead
+                msg = make_reply(e, serializer)
+            if sample:
+                sample.mark("serialize")
+            return msg, sample
 
         async def recv_send():
+            """REP mode: receives, executes and replies to one statement at a time."""
+            zframes = await sck_rep.recv_multipart(copy=False)
+            msg, sample = await handle_statement([zframe.buffer for zframe in zframes])
+            await sck_rep.send_multipart(msg, copy=False)
+            if sample:
+                sample.mark("send")
+                metrics.record(sample)
+
+        async def reply_routed(envelope, zframes):
+            """ROUTER mode: executes statement and sends result back to the client identified by envelope."""
             try:
-                st = await sck_rep.recv()
-                commandname, has_data, data, command, exception = parse_statement(st)
-                if exception:
-                    result = exception
-                else:
-                    result = await execute_command(command.method, data)
-
-                try:
-                    msg = pickle.dumps(result)
-                except BaseException as e:
-                    self.logger.exception("Error pickling result")
-                    # Sends exception to client instead
-                    msg = pickle.dumps(e)
-                    await sck_rep.send(msg)
-                else:
-                    await sck_rep.send(msg)
+                msg, sample = await handle_statement([zframe.buffer for zframe in zframes])
+                await sck_rep.send_multipart(envelope+msg, copy=False)
+                if sample:
+                    sample.mark("send")
+                    metrics.record(sample)
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                self.logger.exception("Error replying to routed statement")
+            finally:
+                inflight.release()
 
-            except zmq.Again:
-                return False
-            return True
+        async def recv_dispatch():
+            """ROUTER mode: receives statement and dispatches it to its own task."""
+            await inflight.acquire()
+            try:
+                zframes = await sck_rep.recv_multipart(copy=False)
+            except BaseException:
+                inflight.release()
+                raise
+            # zframes: [identity, ..., b"", statement frame(s)], as prepended by the ROUTER socket to REQ messages
+            idx = next((i for i, zframe in enumerate(zframes) if len(zframe) == 0), None)
+            if idx is None:
+                inflight.release()
+                self.logger.error(f"Discarding message without envelope delimiter ({len(zframes)} frames)")
+                return
+            task = asyncio.create_task(reply_routed(zframes[:idx+1], zframes[idx+1:]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        pickleserializer = sl.get_serializer("pickle")
+        metrics = self.__metrics
 
         def _ctrl_z_handler(signum, frame):
             print("Don't press Ctrl+Z 😠, or clean-up code won't be executed 😱; Ctl+C should do thou 😜")
@@ -280,14 +378,19 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
             self.read_configfile()
             if a107.ensure_path(self.datadir):
                 self.logger.info(f"Created directory '{self.datadir}'")
-            ctx = zmq.asyncio.Context()
-            sl.lowstate.numcontexts += 1
-            sck_rep = ctx.socket(zmq.REP)
+            ctx = sl.acquire_context()
+            flag_router = self.cfg.flag_router
+            sck_rep = ctx.socket(zmq.ROUTER if flag_router else zmq.REP)
             sl.lowstate.numsockets += 1
+            # ROUTER mode: statements being executed, and limit on how many of them
+            tasks = set()
+            inflight = asyncio.Semaphore(self.cfg.maxinflight)
+            receive = recv_dispatch if flag_router else recv_send
 
             # === BINDING
             try:
-                self.logger.info(f"Binding ``{self.subappname}'' (REP) to {self.url} at {a107.now_str()} ...")
+                self.logger.info(f"Binding ``{self.subappname}'' ({'ROUTER' if flag_router else 'REP'}) to {self.url} "
+                                 f"at {a107.now_str()} ...")
                 sck_rep.bind(self.url)
             except zmq.ZMQError as e:
                 self.logger.error(f"Cannot bind to {self.url}: {a107.str_exc(e)}")
@@ -299,26 +402,28 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
             await self._on_initialize()
             # MAIN LOOP ...
             self.__state = ServerState.LOOP
+            self.__looping.set()
             try:
+                # Awaiting on the socket suspends the main loop until there is something to receive
                 while True:
-                    did_sth = await recv_send()
-                    if not did_sth:
-                        # Sleeps because tired of doing nothing
-                        if self.sleepinterval > 0:
-                            await asyncio.sleep(self.sleepinterval)
+                    await receive()
             except asyncio.CancelledError:
                 raise
             finally:
                 self.__state = ServerState.STOPPED
                 self.logger.debug(f"{self.__class__.__name__}.__mainloop() finally'")
 
+                for task in list(tasks):
+                    task.cancel()
+                # lets cancelled statements finish (they still use sck_rep to reply)
+                await asyncio.gather(*tasks, return_exceptions=True)
                 self.stop()
                 await self.close()
 
                 sck_rep.close()
                 sl.lowstate.numsockets -= 1
-                ctx.destroy()
-                sl.lowstate.numcontexts -= 1
+                sl.release_context(ctx)
+                sl.flush_spans()
         finally:
             self.logger.info(f"Exiting {self.__class__.__name__}.__mainloop()")
 
@@ -326,6 +431,16 @@ class Server(_api.WithCfg, _api.WithCommands, _api.WithClosers, _api.WithSleeper
         """Initialize-on-demand, in server case will assert that server is initialized."""
         assert self.__state == ServerState.LOOP
 
+    async def _execute_command(self, command, args, kwargs):
+        """(MetaCommand, list, dict) --> (result or exception) (does not raise)."""
+
+        try:
+            ret = await command.invoke(*args, **kwargs)
+        except BaseException as e:
+            self.logger.exception(f"Error executing '{command.name}'")
+            ret = e
+        return ret
+
 
 def _get_scpairs(scpairs):
     if not scpairs:
@@ -21,15 +21,15 @@ class WithCSVColumns:
         await self._i_set_cellvalues(id_, values, tablename, columnname)
 
     async def _i_set_cellvalues(self, id_, values, tablename, columnname):
-        db = self.master.dbfile
+        db = self.master.db
         as_str = a107.join_cell(values)
-        db.execute(f"update {tablename} set {columnname}=? where id={id_}", (as_str,))
-        db.commit()
+        async with db.transaction():
+            await db.execute(f"update {tablename} set {columnname}=? where id={id_}", (as_str,))
 
     async def _i_get_cellvalues(self, id_, tablename, columnname):
-        db = self.master.dbfile
+        db = self.master.db
         try:
-            cell = db.get_scalar(f"select {columnname} from {tablename} where id={id_}")
+            cell = await db.get_scalar(f"select {columnname} from {tablename} where id={id_}")
         except a107.NoData:
             raise a107.NoData(f"Id {id_} does not exists in table '{tablename}'")
         if cell is None:
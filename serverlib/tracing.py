@@ -0,0 +1,112 @@
+"""
+Trace context propagated from Client to Server (and on to subservers and agent tasks)
+
+A trace is a tree of spans. The current span is kept in a context variable, so it follows the asyncio task handling a
+statement. Client sends it along with statements (see serverlib._api.wire) and the server opens a child span around
+the command execution; any server call made by the command is therefore part of the same trace.
+
+Spans are exported to the file config.tracefile (if set) in the Chrome trace event format, one event per line; the
+file can be loaded as is into chrome://tracing or https://ui.perfetto.dev.
+"""
+
+__all__ = ["TraceContext", "get_trace", "span", "flush_spans"]
+
+import atexit, contextlib, contextvars, json, os, time
+from dataclasses import dataclass
+from .config import config
+
+
+@dataclass(frozen=True)
+class TraceContext:
+    traceid: str
+    spanid: str
+
+    def to_header(self):
+        return f"{self.traceid}:{self.spanid}"
+
+    @classmethod
+    def from_header(cls, header):
+        """Inverse of to_header(); returns None if header is invalid."""
+        traceid, _, spanid = header.partition(":")
+        if not traceid or not spanid:
+            return None
+        return cls(traceid, spanid)
+
+
+_current = contextvars.ContextVar("serverlib_trace", default=None)
+
+
+def get_trace():
+    """Returns current TraceContext or None."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def span(name, parent=None, flag_new_trace=False, **args):
+    """Context manager that makes a new span the current one; yields its TraceContext, or None if not tracing.
+
+    Args:
+        name: span name
+        parent: parent TraceContext. Defaults to the current one
+        flag_new_trace: whether to start a new trace if there is no parent. Otherwise, does nothing without a parent
+        **args: extra information to be exported with span
+    """
+    if parent is None:
+        parent = _current.get()
+        if parent is None and not flag_new_trace:
+            yield None
+            return
+    trace = TraceContext(parent.traceid if parent else os.urandom(16).hex(), os.urandom(8).hex())
+    token = _current.set(trace)
+    t = time.time()
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        if config.tracefile:
+            _exporter.write(name, t, time.time()-t, trace, parent, args)
+
+
+def flush_spans():
+    """Writes buffered spans to config.tracefile."""
+    _exporter.flush()
+
+
+class _Exporter:
+    def __init__(self):
+        self.path = None
+        self.file = None
+
+    def write(self, name, starttime, duration, trace, parent, args):
+        if self.path != config.tracefile:
+            self.close()
+            self.path = config.tracefile
+            path = os.path.expanduser(self.path)
+            flag_new = not os.path.isfile(path) or os.path.getsize(path) == 0
+            self.file = open(path, "a")
+            if flag_new:
+                self.file.write("[\n")
+        event = {"name": name,
+                 "cat": "serverlib",
+                 "ph": "X",
+                 "ts": int(starttime*1e6),
+                 "dur": int(duration*1e6),
+                 "pid": os.getpid(),
+                 # one row per trace in the trace viewer
+                 "tid": int(trace.traceid[:8], 16),
+                 "args": {"traceid": trace.traceid, "spanid": trace.spanid,
+                          "parentid": parent.spanid if parent else None, **args}}
+        self.file.write(json.dumps(event, default=str)+",\n")
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+_exporter = _Exporter()
+atexit.register(_exporter.close)